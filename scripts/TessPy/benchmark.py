@@ -0,0 +1,67 @@
+'''check exported translations against the hand-validated benchmark
+
+This is the rank-1 precision test from validate.R, so that the effect of
+a change in the export options can be seen without leaving python.
+'''
+
+import csv
+import unicodedata
+
+
+def _nfkc(s):
+	return unicodedata.normalize('NFKC', s)
+
+
+def read_benchmark(filename):
+	'''dict of (greek, latin) pairs to 1 (valid) or 0 (not)'''
+
+	with open(filename, 'r', encoding='utf_8', newline='') as f:
+		return {(_nfkc(r['greek']), _nfkc(r['latin'])): int(r['valid'])
+			for r in csv.DictReader(f) if r['valid'] in ('0', '1')}
+
+
+def top_pairs(filename, swap=False):
+	'''(greek, latin, score) for the first hit on each line of an export;
+	with swap, the export runs from latin to greek'''
+
+	pairs = []
+
+	with open(filename, 'r', encoding='utf_8') as f:
+		for line in f:
+			head, _, hits = line.rstrip('\n').partition(',')
+
+			if hits == '':
+				continue
+
+			word, _, score = hits.split(',')[0].rpartition(':')
+
+			if swap:
+				head, word = word, head
+
+			pairs.append((_nfkc(head), _nfkc(word), float(score)))
+
+	return pairs
+
+
+def precision(filename, bench, swap=False, cutoff=0):
+	'''right, wrong and unjudged top hits for the benchmark's greek words,
+	counting only hits scoring at least cutoff'''
+
+	headwords = set(g for g, l in bench)
+
+	right = wrong = missing = 0
+
+	for greek, latin, score in top_pairs(filename, swap):
+		if greek not in headwords or score < cutoff:
+			continue
+
+		valid = bench.get((greek, latin))
+
+		if valid is None:
+			missing += 1
+		elif valid:
+			right += 1
+		else:
+			wrong += 1
+
+	return right, wrong, missing
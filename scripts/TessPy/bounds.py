@@ -0,0 +1,47 @@
+'''upper bounds on cosine similarity, for skipping work below a threshold'''
+
+import numpy as np
+from gensim import matutils
+
+
+def abs_unit(vectors, ids):
+	'''absolute values of the vectors at ids, scaled to unit length, as
+	the rows of a CSR matrix'''
+
+	if hasattr(vectors, 'matrix'):
+		m = vectors.matrix[ids]
+	else:
+		m = matutils.corpus2csc([vectors[i] for i in ids],
+			num_docs=len(ids), dtype=np.float32).T
+
+	m = abs(m.tocsr().astype(np.float32))
+
+	norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+	norms[norms == 0] = 1
+
+	return m.multiply(1 / norms[:, None]).tocsr()
+
+
+def peak(m):
+	'''largest value in each column of a sparse matrix'''
+
+	if m.shape[0] == 0:
+		return np.zeros(m.shape[1], dtype=np.float32)
+
+	return m.max(axis=0).toarray().ravel()
+
+
+def cosine_bounds(vectors, q_ids, c_ids):
+	'''for each query, an upper bound on its cosine similarity with any
+	candidate, and the same for each candidate against the queries
+
+	A cosine is a sum over terms of products of the two unit vectors'
+	weights, and so can be no more than the sum over the query's terms of
+	its weight times the largest weight any candidate has for that term.
+	'''
+
+	m = abs_unit(vectors, np.concatenate([q_ids, c_ids]))
+
+	q, c = m[:len(q_ids)], m[len(q_ids):]
+
+	return (np.minimum(q.dot(peak(c)), 1), np.minimum(c.dot(peak(q)), 1))
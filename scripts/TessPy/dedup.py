@@ -0,0 +1,68 @@
+'''score each distinct definition vector once
+
+Many headwords end up with the same bag of words (one-word definitions
+like "bull" are common), and so the same vector.  Similarities are
+computed between the distinct vectors only, and copied out to every
+headword that shares one.
+'''
+
+import numpy as np
+
+
+def unique_vectors(vectors):
+	'''group identical sparse vectors
+
+	Returns the position of the first vector in each group, and for each
+	vector the number of its group; groups are numbered in order of first
+	appearance.
+	'''
+
+	groups = dict()
+	first = []
+	inverse = np.empty(len(vectors), dtype=np.int64)
+
+	for i, vec in enumerate(vectors):
+		key = tuple(vec)
+		g = groups.get(key)
+
+		if g is None:
+			g = groups[key] = len(first)
+			first.append(i)
+
+		inverse[i] = g
+
+	return np.array(first, dtype=np.int64), inverse
+
+
+def select(vectors, ids):
+	'''the vectors at positions ids, in the same form of corpus'''
+
+	if hasattr(vectors, 'matrix'):
+		return type(vectors)(vectors.matrix[ids])
+
+	return [vectors[i] for i in ids]
+
+
+class Deduplicated:
+	'''Similarity over all documents by way of one over the distinct vectors
+
+	`similarity` scores distinct vectors (by group number) against the
+	distinct candidate vectors `cand_groups`, a sorted array; `inverse`
+	gives each document's group.  Blocks come back with a row for every
+	query and a column for every candidate in `cand_ids`, exactly as if
+	nothing had been merged.
+	'''
+
+	def __init__(self, similarity, inverse, cand_ids):
+		self.similarity = similarity
+		self.inverse = inverse
+		self.cand_groups, self.cand_pos = np.unique(inverse[cand_ids],
+			return_inverse=True)
+
+	def __call__(self, q_ids):
+		groups, rows = np.unique(self.inverse[q_ids], return_inverse=True)
+
+		return self.similarity(groups)[np.ix_(rows, self.cand_pos)]
+
+	def correction(self, q_ids, top):
+		return self.similarity.correction(self.inverse[q_ids], self.cand_pos[top])
@@ -0,0 +1,277 @@
+'''block-at-a-time export of similarity results'''
+
+import os
+import json
+import time
+import queue
+import threading
+
+import numpy as np
+
+# marks the end of a stream of blocks
+
+_done = object()
+
+
+def _put(q, item, stop):
+	'''put to a bounded queue, giving up if another stage has failed'''
+
+	while not stop.is_set():
+		try:
+			q.put(item, timeout=0.1)
+			return True
+		except queue.Full:
+			pass
+
+	return False
+
+
+def _get(q, stop):
+	'''get from a queue, giving up if another stage has failed'''
+
+	while not stop.is_set():
+		try:
+			return q.get(timeout=0.1)
+		except queue.Empty:
+			pass
+
+	return _done
+
+
+def top_hits(block, k):
+	'''positions and scores of the k best columns in each row, best first'''
+
+	k = min(k, block.shape[1])
+
+	if k == 0:
+		empty = np.empty((block.shape[0], 0))
+		return empty.astype(np.int64), empty.astype(block.dtype)
+
+	# the k-th best score in each row, then everything above it and as
+	# many of the columns equal to it as are needed, earliest first, so
+	# ties at the cut-off go the same way as in a stable sort
+
+	kth = -np.partition(-block, k - 1, axis=1)[:, k - 1, None]
+
+	above = block > kth
+	ties = block == kth
+	need = k - above.sum(axis=1, keepdims=True)
+
+	keep = above | (ties & (np.cumsum(ties, axis=1) <= need))
+
+	top = np.nonzero(keep)[1].reshape(block.shape[0], k)
+	scores = np.take_along_axis(block, top, axis=1)
+
+	# order by score; ties go to the earlier column, as they did when
+	# each row was sorted in full
+
+	order = np.lexsort((top, -scores), axis=1)
+
+	return (np.take_along_axis(top, order, axis=1),
+		np.take_along_axis(scores, order, axis=1))
+
+
+class ColumnTop:
+	'''The k best rows for every column, over a stream of row blocks
+
+	After all the blocks have been seen, `ids` and `scores` are
+	(columns x k) arrays, best first; unfilled places have id -1
+	and score -inf.
+	'''
+
+	def __init__(self, n_cols, k):
+		self.k = k
+		self.ids = np.full((n_cols, k), -1, dtype=np.int64)
+		self.scores = np.full((n_cols, k), -np.inf, dtype=np.float32)
+
+	def update(self, block, row_ids):
+		'''fold in a (rows x columns) block of scores'''
+
+		top, scores = top_hits(block.T, self.k)
+
+		ids = np.concatenate([self.ids, row_ids[top]], axis=1)
+		scores = np.concatenate([self.scores, scores], axis=1)
+
+		# earlier rows stay ahead of later ones with the same score
+		best, self.scores = top_hits(scores, self.k)
+		self.ids = np.take_along_axis(ids, best, axis=1)
+
+
+def mutual(q_ids, fwd, c_ids, rev):
+	'''which hits are mutual nearest neighbours
+
+	q_ids and c_ids are sorted arrays of query and candidate ids; fwd
+	holds the candidate ids found for each query, rev the query ids found
+	for each candidate.  Returns boolean masks shaped like fwd and rev.
+	'''
+
+	pos = np.minimum(np.searchsorted(c_ids, fwd), len(c_ids) - 1)
+	fwd_ok = (c_ids[pos] == fwd) & (rev[pos] == q_ids[:, None, None]).any(axis=2)
+
+	pos = np.minimum(np.searchsorted(q_ids, rev), len(q_ids) - 1)
+	rev_ok = (q_ids[pos] == rev) & (fwd[pos] == c_ids[:, None, None]).any(axis=2)
+
+	return fwd_ok, rev_ok
+
+
+class Coalescer:
+	'''write callback for run_stages gathering output into large writes'''
+
+	def __init__(self, file_out, bufsize=1<<20):
+		self.file_out = file_out
+		self.bufsize = bufsize
+		self.buf = []
+		self.size = 0
+
+	def __call__(self, k, data):
+		self.buf.append(data)
+		self.size += len(data)
+
+		if self.size >= self.bufsize:
+			self.flush()
+
+	def flush(self):
+		'''write out whatever has been gathered so far'''
+
+		if self.buf:
+			self.file_out.write(b''.join(self.buf))
+			self.buf = []
+			self.size = 0
+
+
+class Checkpoint:
+	'''write callback for run_stages that can survive being interrupted
+
+	Output goes to `output`.part.  Every `interval` seconds the buffer is
+	flushed to disk and `output`.ckpt records the number of blocks done
+	and the length of the file at that point.  With `resume`, a matching
+	checkpoint is read back, anything written after it is cut off, and
+	`done` tells the caller how many blocks to skip.  finish() renames
+	the completed output into place.
+	'''
+
+	def __init__(self, output, key, resume=False, interval=300, bufsize=1<<20):
+		self.output = output
+		self.part = output + '.part'
+		self.ckpt = output + '.ckpt'
+		self.key = key
+		self.interval = interval
+		self.done = 0
+
+		offset = 0
+
+		if resume:
+			try:
+				with open(self.ckpt, 'r', encoding='utf_8') as f:
+					state = json.load(f)
+
+				if state['key'] == key and os.path.getsize(self.part) >= state['bytes']:
+					self.done = state['blocks']
+					offset = state['bytes']
+			except (IOError, OSError, ValueError, KeyError):
+				pass
+
+		if offset > 0:
+			self.file = open(self.part, 'r+b')
+			self.file.truncate(offset)
+			self.file.seek(offset)
+		else:
+			self.file = open(self.part, 'wb')
+
+		self.sink = Coalescer(self.file, bufsize)
+		self.last = time.time()
+
+	def __call__(self, k, data):
+		self.sink(k, data)
+		self.done = k + 1
+
+		if time.time() - self.last >= self.interval:
+			self.save()
+
+	def save(self):
+		'''make everything written so far durable, then record it'''
+
+		self.sink.flush()
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+		tmp = self.ckpt + '.tmp'
+
+		with open(tmp, 'w', encoding='utf_8') as f:
+			json.dump({'key': self.key, 'blocks': self.done,
+				'bytes': self.file.tell()}, f)
+			f.flush()
+			os.fsync(f.fileno())
+
+		os.replace(tmp, self.ckpt)
+		self.last = time.time()
+
+	def finish(self):
+		'''move the complete output into place'''
+
+		self.sink.flush()
+		self.file.close()
+
+		os.replace(self.part, self.output)
+
+		if os.path.exists(self.ckpt):
+			os.remove(self.ckpt)
+
+
+def run_stages(blocks, format_block, write_block, depth=4):
+	'''compute, format and write blocks concurrently
+
+	Three threads are joined by queues holding at most `depth` blocks:
+	one draws computed blocks from the iterable `blocks` (numpy releases
+	the GIL during the matrix products), one turns each block into a
+	(block number, bytes) pair with `format_block`, and one passes those
+	to `write_block`, in order.  An exception in any stage stops the
+	others and is raised again here.
+	'''
+
+	formatted = queue.Queue(depth)
+	computed = queue.Queue(depth)
+	stop = threading.Event()
+	errors = []
+
+	def stage(func):
+		def run():
+			try:
+				func()
+			except BaseException as err:
+				errors.append(err)
+				stop.set()
+		return threading.Thread(target=run, daemon=True)
+
+	def compute():
+		for block in blocks:
+			if not _put(computed, block, stop):
+				return
+		_put(computed, _done, stop)
+
+	def convert():
+		while True:
+			block = _get(computed, stop)
+			if block is _done:
+				break
+			if not _put(formatted, format_block(block), stop):
+				return
+		_put(formatted, _done, stop)
+
+	def write():
+		while True:
+			item = _get(formatted, stop)
+			if item is _done:
+				break
+			write_block(*item)
+
+	threads = [stage(compute), stage(convert), stage(write)]
+
+	for t in threads:
+		t.start()
+
+	for t in threads:
+		t.join()
+
+	if errors:
+		raise errors[0]
@@ -0,0 +1,175 @@
+'''tf-idf vectors in one streaming pass, using the hashing trick
+
+Instead of building a dictionary of terms first and then converting each
+document, every term is hashed straight to one of a fixed number of
+buckets.  Term counts go into the arrays of a CSR matrix as the documents
+stream past, and document frequencies fall out of its column indices, so
+the corpus is read once and never held in memory as python lists.
+'''
+
+import json
+import zlib
+from array import array
+
+import numpy as np
+import scipy.sparse
+
+
+def iter_json_list(filename, chunk=1<<20):
+	'''yield the items of a JSON list in a file without loading it whole'''
+
+	decoder = json.JSONDecoder()
+
+	with open(filename, 'r', encoding='utf_8') as f:
+		buf = ''
+		pos = 0
+		started = False
+		eof = False
+
+		while True:
+			# skip separators
+			while pos < len(buf) and buf[pos] in ' \t\r\n,':
+				pos += 1
+
+			if pos < len(buf) and not started:
+				if buf[pos] != '[':
+					raise ValueError('{0} is not a JSON list'.format(filename))
+				started = True
+				pos += 1
+				continue
+
+			if pos < len(buf) and buf[pos] == ']':
+				return
+
+			try:
+				if pos == len(buf):
+					raise ValueError
+				item, pos = decoder.raw_decode(buf, pos)
+			except ValueError:
+				# an item cut off by the end of the buffer; read some more
+				if eof:
+					raise ValueError('{0} ends in the middle of the list'.format(filename))
+
+				more = f.read(chunk)
+				eof = (more == '')
+				buf = buf[pos:] + more
+				pos = 0
+				continue
+
+			yield item
+
+
+def bucket(term, n_buckets):
+	'''the bucket a term hashes to; unlike hash(), the same in every process'''
+
+	return zlib.crc32(term.encode('utf_8')) % n_buckets
+
+
+class CsrCorpus:
+	'''A CSR matrix dressed up as a gensim corpus
+
+	Indexing and iterating give rows as lists of (column, value) pairs,
+	as gensim expects; `matrix` is there for code that can use it whole.
+	'''
+
+	def __init__(self, matrix):
+		self.matrix = matrix
+
+	def __len__(self):
+		return self.matrix.shape[0]
+
+	def __getitem__(self, i):
+		start, end = self.matrix.indptr[i], self.matrix.indptr[i+1]
+
+		return list(zip(self.matrix.indices[start:end].tolist(),
+			self.matrix.data[start:end].tolist()))
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+
+class HashingVectorizer:
+	'''Turns a stream of tokenized documents into a tf-idf CSR matrix
+
+	Weights are those of gensim's default TfidfModel (raw counts times
+	log2 of the number of documents over the document frequency, rows
+	scaled to unit length), so with enough buckets that no terms collide
+	the vectors are the same as the dictionary-based ones.
+
+	After transform(), `terms` counts the distinct terms seen and
+	`collisions` the terms that landed in a bucket already in use.
+	'''
+
+	def __init__(self, n_buckets=1<<20, stopwords=()):
+		self.n_buckets = n_buckets
+		self.stopwords = frozenset(stopwords)
+		self.terms = 0
+		self.collisions = 0
+
+	def transform(self, docs, min_df=1, max_df=1.0, max_features=0):
+		'''tf-idf matrix for an iterable of token lists, after dropping
+		buckets found in fewer than min_df documents, in more than a
+		fraction max_df of them, or outside the max_features most common'''
+
+		seen = dict()
+		indptr = array('q', [0])
+		indices = array('i')
+		counts = array('f')
+
+		for doc in docs:
+			tf = dict()
+
+			for term in doc:
+				if term in self.stopwords:
+					continue
+
+				b = seen.get(term)
+
+				if b is None:
+					b = seen[term] = bucket(term, self.n_buckets)
+
+				tf[b] = tf.get(b, 0) + 1
+
+			for b in sorted(tf):
+				indices.append(b)
+				counts.append(tf[b])
+
+			indptr.append(len(indices))
+
+		n_docs = len(indptr) - 1
+
+		self.terms = len(seen)
+		self.collisions = self.terms - len(set(seen.values()))
+
+		indices = np.frombuffer(indices, dtype=np.int32)
+		counts = np.frombuffer(counts, dtype=np.float32)
+
+		# each bucket appears at most once per row, so its column count
+		# is its document frequency
+
+		df = np.bincount(indices, minlength=self.n_buckets)
+
+		keep = (df >= min_df) & (df <= max_df * n_docs) & (df > 0)
+
+		if max_features > 0 and keep.sum() > max_features:
+			# most common first, ties to the lower bucket
+			order = np.lexsort((np.arange(self.n_buckets), -np.where(keep, df, -1)))
+			keep[:] = False
+			keep[order[:max_features]] = True
+
+		idf = np.zeros(self.n_buckets, dtype=np.float32)
+		idf[keep] = np.log2(n_docs / df[keep])
+
+		matrix = scipy.sparse.csr_matrix(
+			(counts * idf[indices], indices, np.frombuffer(indptr, dtype=np.int64)),
+			shape=(n_docs, self.n_buckets))
+
+		# terms in every document get no weight; gensim drops them too
+		matrix.eliminate_zeros()
+
+		norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+		norms[norms == 0] = 1
+		matrix = scipy.sparse.diags(1 / norms).dot(matrix).tocsr()
+
+		return matrix.astype(np.float32)
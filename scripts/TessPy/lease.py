@@ -0,0 +1,224 @@
+'''share numbered blocks of work among nodes through a common directory
+
+Nothing but the filesystem is needed to coordinate: a worker claims a
+block by creating its lease file exclusively, keeps it alive by touching
+it, and finishes by renaming the block's output into place.  A lease that
+hasn't been touched for `ttl` seconds is taken to belong to a dead worker
+and may be stolen.  Outputs are written whole and renamed atomically, so
+if a stolen block is finished twice the second copy simply replaces the
+first.
+'''
+
+import os
+import json
+import time
+import socket
+import threading
+
+
+def worker_name():
+	'''a name for this process unique across the cluster'''
+
+	return '{0}-{1}-{2}'.format(socket.gethostname(), os.getpid(),
+		os.urandom(3).hex())
+
+
+class SharedRun:
+	'''A run of `n_blocks` blocks of work shared out through directory `path`
+
+	The first worker to arrive records the number of blocks and a `key`
+	describing the job in a manifest; later workers must present the same
+	key, so that nodes with different inputs or options can't mix their
+	output.  Leave out n_blocks and key to attach to an existing run.
+	'''
+
+	def __init__(self, path, n_blocks=None, key=None, ttl=600):
+		self.path = path
+		self.ttl = ttl
+		self.worker = worker_name()
+		self.held = set()
+		self.lock = threading.Lock()
+
+		os.makedirs(os.path.join(path, 'leases'), exist_ok=True)
+		os.makedirs(os.path.join(path, 'blocks'), exist_ok=True)
+
+		manifest = os.path.join(path, 'manifest.json')
+
+		if n_blocks is not None and not os.path.exists(manifest):
+			tmp = '{0}.{1}'.format(manifest, self.worker)
+
+			with open(tmp, 'w', encoding='utf_8') as f:
+				json.dump({'blocks': n_blocks, 'key': key}, f)
+
+			# link fails if another worker got there first
+			try:
+				os.link(tmp, manifest)
+			except FileExistsError:
+				pass
+			finally:
+				os.unlink(tmp)
+
+		with open(manifest, 'r', encoding='utf_8') as f:
+			info = json.load(f)
+
+		if n_blocks is not None and (info['blocks'], info['key']) != (n_blocks, key):
+			raise ValueError('{0} holds a different run'.format(path))
+
+		self.n_blocks = info['blocks']
+
+	def _lease(self, k):
+		return os.path.join(self.path, 'leases', str(k))
+
+	def _block(self, k):
+		return os.path.join(self.path, 'blocks', '{0}.csv'.format(k))
+
+	def missing(self):
+		'''numbers of the blocks that have no output yet'''
+
+		done = set(os.listdir(os.path.join(self.path, 'blocks')))
+
+		return [k for k in range(self.n_blocks)
+			if '{0}.csv'.format(k) not in done]
+
+	def _acquire(self, k):
+		'''try to take the lease on block k, stealing it if it has expired'''
+
+		lease = self._lease(k)
+
+		for attempt in range(2):
+			try:
+				fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+			except FileExistsError:
+				pass
+			else:
+				os.write(fd, self.worker.encode('utf_8'))
+				os.close(fd)
+
+				with self.lock:
+					self.held.add(k)
+
+				return True
+
+			# the lease is held; if it's stale, move it out of the way.
+			# only one of several would-be thieves can win the rename.
+
+			try:
+				if time.time() - os.stat(lease).st_mtime < self.ttl:
+					return False
+
+				stale = '{0}.{1}.stale'.format(lease, self.worker)
+				os.rename(lease, stale)
+				os.unlink(stale)
+			except FileNotFoundError:
+				pass
+
+		return False
+
+	def _release(self, k):
+		'''give up the lease on block k, if nobody has stolen it'''
+
+		with self.lock:
+			self.held.discard(k)
+
+		lease = self._lease(k)
+
+		try:
+			with open(lease, 'r', encoding='utf_8') as f:
+				mine = f.read() == self.worker
+
+			if mine:
+				os.unlink(lease)
+		except FileNotFoundError:
+			pass
+
+	def _renew(self, stop):
+		'''touch held leases until told to stop'''
+
+		while not stop.wait(self.ttl / 4):
+			with self.lock:
+				held = list(self.held)
+
+			for k in held:
+				try:
+					os.utime(self._lease(k))
+				except FileNotFoundError:
+					pass
+
+	def claim(self, poll=10):
+		'''yield the numbers of blocks this worker has claimed
+
+		Keeps going until every block has output, waiting for blocks
+		leased by other workers either to be finished or to expire.
+		'''
+
+		stop = threading.Event()
+		renewer = threading.Thread(target=self._renew, args=(stop,), daemon=True)
+		renewer.start()
+
+		try:
+			while True:
+				todo = self.missing()
+
+				if not todo:
+					return
+
+				claimed = False
+
+				for k in todo:
+					if os.path.exists(self._block(k)):
+						continue
+
+					if not self._acquire(k):
+						continue
+
+					# the block may have been committed, and its lease
+					# released, since it was checked for above
+
+					if os.path.exists(self._block(k)):
+						self._release(k)
+						continue
+
+					claimed = True
+					yield k
+
+				# nothing claimable: wait for our own blocks to be
+				# committed, or for other workers' to finish or expire.
+				# blocks finished during the pass above need no wait
+
+				if not claimed and len(self.missing()) == len(todo):
+					time.sleep(0.1 if self.held else poll)
+		finally:
+			stop.set()
+
+	def commit(self, k, data):
+		'''save the output of block k and release its lease'''
+
+		tmp = '{0}.{1}'.format(self._block(k), self.worker)
+
+		with open(tmp, 'wb') as f:
+			f.write(data)
+			f.flush()
+			os.fsync(f.fileno())
+
+		os.replace(tmp, self._block(k))
+
+		self._release(k)
+
+	def merge(self, output):
+		'''concatenate block outputs in order; fail if any are missing'''
+
+		missing = self.missing()
+
+		if missing:
+			raise ValueError('{0} of {1} blocks unfinished, e.g. {2}'.format(
+				len(missing), self.n_blocks,
+				', '.join(str(k) for k in missing[:10])))
+
+		tmp = '{0}.{1}'.format(output, self.worker)
+
+		with open(tmp, 'wb') as f:
+			for k in range(self.n_blocks):
+				with open(self._block(k), 'rb') as block:
+					f.write(block.read())
+
+		os.replace(tmp, output)
@@ -0,0 +1,267 @@
+'''entries of the Perseus lexica: cleaning, and random access by headword
+
+Each entry of the XML lexica is a single <entryFree> element on a line of
+its own.  The index built here lists every entry's standardized headword,
+language, byte offset and length, sorted, in a small text file:
+
+	headword <tab> language <tab> offset <tab> length
+
+Both the index and the lexica are memory-mapped, and the index is binary
+searched, so looking up a headword touches a few pages rather than
+reparsing a whole lexicon.
+'''
+
+import os
+import re
+import mmap
+
+from TessPy import tesslang
+
+
+class pat:
+	'''Useful regular expressions'''
+	
+	# lexicon entry
+	
+	entry = re.compile(r'<entryFree [^>]*key="(.+?)"[^>]*>(.+?)</entryFree>')
+	
+	# XML nodes to omit
+	
+	stop = [
+		re.compile(pat) for pat in [
+			r'<cit>.*?</cit>',
+			r'<bibl .+?>.*?</bibl>',
+			r'<orth .+?>.*?</orth>',
+			r'<etym .+?>.*?</etym>',
+			r'<itype .+?>.*?</itype>',
+			r'<pos .+?>.*?</pos>',
+			r'<number .+?>.*?</number>',
+			r'<gen .+?>.*?</gen>',
+			r'<mood .+?>.*?</mood>',
+			r'<case .+?>.*?</case>',
+			r'<tns .+?>.*?</tns>',
+			r'<per .+?>.*?</per>',
+			r'<pron .+?>.*?</pron>',
+			r'<date>.*?</date>',
+			r'<usg .+?>.*?</usg>',
+			r'<gramGrp .+?>.*?</gramGrp>'
+		]
+	]
+	
+	# language-specific regular expressions matching the parts of
+	# dictionary entries that are English definitions of the headword
+	
+	definition = {
+		'la': re.compile(r'<hi [^>]*rend="ital"[^>]*>(.+?)</hi>'),
+		'grc': re.compile(r'<tr\b[^>]*>(.+?)</tr>')
+	}
+	
+	# betacode greek tag
+	# note that both dictionaries use <foreign lang="greek">
+	# while neither uses <foreign> for any other language
+	# (inside definitions, anyway)
+	
+	foreign = re.compile(r'<foreign lang="greek">(.+?)</foreign>')
+	
+	# stuff to remove from english entries
+	
+	clean = {
+		'any': re.compile(r'\W+'),
+		'la': re.compile(r'[^a-z]'),
+		'grc': re.compile(r'[\^_]')
+	}
+	
+	number = re.compile(r'[0-9]')
+
+
+def mo_beta2uni(mo):
+	'''A wrapper for tesslang.beta_to_uni that takes match objects'''
+	
+	return tesslang.beta_to_uni(mo.group(1))
+
+
+def clean_head(lang, key):
+	'''the headword from an entry's key, ready to be standardized'''
+
+	key = pat.clean[lang].sub('', key)
+
+	return pat.number.sub('', key)
+
+
+def clean_entry(lang, entry):
+	'''the english definitions in the body of an entry'''
+
+	# remove elements on the stoplist
+
+	for stop in pat.stop:
+		entry = stop.sub('', entry)
+
+	# transliterate betacode to unicode chars
+	# in foreign tags
+
+	entry = pat.foreign.sub(mo_beta2uni, entry)
+
+	# extract strings marked as translations of the headword,
+	# dropping empty ones
+
+	return [d for d in pat.definition[lang].findall(entry) if not d.isspace()]
+
+
+# the entry pattern, for matching bytes so offsets come out in bytes
+
+_entry_bytes = re.compile(pat.entry.pattern.encode('utf_8'))
+
+
+def _stamp(filename):
+	info = os.stat(filename)
+
+	return '{0}\t{1}'.format(info.st_size, info.st_mtime_ns)
+
+
+def build_index(lexica, filename):
+	'''index the entries of lexica, a list of (language, lexicon file)
+	pairs, in filename; returns the number of entries'''
+
+	records = []
+	header = []
+
+	for lang, path in lexica:
+		header.append('#\t{0}\t{1}\t{2}\n'.format(lang, os.path.abspath(path),
+			_stamp(path)))
+
+		heads = []
+		spans = []
+		offset = 0
+
+		with open(path, 'rb') as f:
+			for line in f:
+				m = _entry_bytes.search(line)
+
+				if m is not None:
+					heads.append(clean_head(lang, m.group(1).decode('utf_8')))
+					spans.append((offset + m.start(), m.end() - m.start()))
+
+				offset += len(line)
+
+		for lemma, (start, length) in zip(tesslang.standardize_many(lang, heads), spans):
+			records.append('{0}\t{1}\t{2}\t{3}\n'.format(lemma, lang,
+				start, length).encode('utf_8'))
+
+	# sorting the encoded lines puts them in the order the binary
+	# search compares them in
+
+	records.sort()
+
+	tmp = filename + '.tmp'
+
+	with open(tmp, 'wb') as f:
+		f.write(''.join(header).encode('utf_8'))
+		f.writelines(records)
+
+	os.replace(tmp, filename)
+
+	return len(records)
+
+
+class LexiconIndex:
+	'''Random access to lexicon entries by standardized headword
+
+	Raises ValueError if a lexicon has changed since the index was built,
+	unless `check` is false.
+	'''
+
+	def __init__(self, filename, check=True):
+		with open(filename, 'rb') as f:
+			self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		# header lines name the lexica, in the order they were indexed
+
+		self.lexica = dict()
+		self.start = 0
+
+		while self.index[self.start:self.start + 1] == b'#':
+			end = self.index.find(b'\n', self.start) + 1
+			line = self.index[self.start:end].decode('utf_8').rstrip('\n')
+			_, lang, path, size, mtime = line.split('\t')
+
+			if check and _stamp(path) != '{0}\t{1}'.format(size, mtime):
+				raise ValueError('{0} has changed since {1} was built'.format(
+					path, filename))
+
+			self.lexica[lang] = path
+			self.start = end
+
+		self.maps = dict()
+
+	def _lexicon(self, lang):
+		'''the lexicon for lang, mapped into memory the first time it's used'''
+
+		if lang not in self.maps:
+			with open(self.lexica[lang], 'rb') as f:
+				self.maps[lang] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		return self.maps[lang]
+
+	def _first(self, key):
+		'''offset of the first index line not less than key'''
+
+		lo, hi = self.start, len(self.index)
+
+		# lo and hi are always at the start of a line
+
+		while lo < hi:
+			mid = (lo + hi) // 2
+			start = self.index.rfind(b'\n', lo, mid) + 1 or lo
+			end = self.index.find(b'\n', start) + 1
+
+			if self.index[start:end] < key:
+				lo = end
+			else:
+				hi = start
+
+		return lo
+
+	def lookup(self, lemma, lang=None):
+		'''(language, offset, length) of each entry for a headword, in
+		lexicon order; lemma is cleaned and standardized first, like the
+		keys were, so key forms such as "amo1" are found too'''
+
+		found = []
+
+		for l in self.lexica:
+			if lang is not None and l != lang:
+				continue
+
+			key = tesslang.standardize(l, clean_head(l, lemma))
+			key = '{0}\t{1}\t'.format(key, l).encode('utf_8')
+			pos = self._first(key)
+
+			while self.index[pos:pos + len(key)] == key:
+				end = self.index.find(b'\n', pos) + 1
+				start, length = self.index[pos + len(key):end - 1].split(b'\t')
+
+				found.append((l, int(start), int(length)))
+				pos = end
+
+		# keep the lexica in the order they were indexed
+
+		order = list(self.lexica)
+
+		return sorted(found, key=lambda e: (order.index(e[0]), e[1]))
+
+	def raw(self, lemma, lang=None):
+		'''(language, XML text) of each entry for a headword'''
+
+		return [(l, self._lexicon(l)[start:start + length].decode('utf_8'))
+			for l, start, length in self.lookup(lemma, lang)]
+
+	def entries(self, lemma, lang=None):
+		'''(language, english definitions) of each entry for a headword,
+		cleaned as read-lexicon.py does it'''
+
+		return [(l, clean_entry(l, pat.entry.search(text).group(2)))
+			for l, text in self.raw(lemma, lang)]
+
+	def close(self):
+		for m in [self.index] + list(self.maps.values()):
+			m.close()
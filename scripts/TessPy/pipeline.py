@@ -0,0 +1,185 @@
+'''run a graph of build stages, in parallel where dependencies allow'''
+
+import os
+import sys
+import json
+import time
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+#
+# one row of the timing summary
+#
+
+Timing = namedtuple('Timing', ['name', 'status', 'start', 'elapsed'])
+
+
+class Stage:
+	'''A command, the files it reads and writes, and the stages it waits for'''
+
+	def __init__(self, name, cmd, inputs=(), outputs=(), deps=()):
+		self.name = name
+		self.cmd = [str(c) for c in cmd]
+		self.inputs = list(inputs)
+		self.outputs = list(outputs)
+		self.deps = list(deps)
+
+	def stamp(self, stampdir):
+		'''path of the file recording the command that last built this stage'''
+
+		return os.path.join(stampdir, self.name + '.stamp')
+
+	def up_to_date(self, stampdir):
+		'''true if all outputs exist, are newer than all inputs,
+		and were built with the same command line'''
+
+		if not self.outputs:
+			return False
+
+		try:
+			with open(self.stamp(stampdir), 'r', encoding='utf_8') as f:
+				if json.load(f) != self.cmd:
+					return False
+
+			oldest = min(os.stat(f).st_mtime for f in self.outputs)
+			newest = max([os.stat(f).st_mtime for f in self.inputs] + [0])
+		except (IOError, OSError, ValueError):
+			return False
+
+		return newest <= oldest
+
+
+def check_graph(stages):
+	'''make sure every dependency exists and there are no cycles'''
+
+	by_name = dict()
+
+	for s in stages:
+		if s.name in by_name:
+			raise ValueError('duplicate stage name: {0}'.format(s.name))
+		by_name[s.name] = s
+
+	for s in stages:
+		for d in s.deps:
+			if d not in by_name:
+				raise ValueError('stage {0} depends on unknown stage {1}'.format(
+					s.name, d))
+
+	# repeatedly strip stages whose deps are all satisfied
+
+	pending = {s.name: set(s.deps) for s in stages}
+	done = set()
+
+	while pending:
+		ready = [n for n in pending if pending[n] <= done]
+
+		if not ready:
+			raise ValueError('dependency cycle among stages: {0}'.format(
+				', '.join(sorted(pending))))
+
+		for n in ready:
+			del pending[n]
+			done.add(n)
+
+	return by_name
+
+
+def run_stage(stage, stampdir, logdir, force, quiet):
+	'''run a single stage unless it is up to date; return its timing'''
+
+	start = time.time()
+
+	if not force and stage.up_to_date(stampdir):
+		if not quiet:
+			print('[{0}] up to date'.format(stage.name))
+		return Timing(stage.name, 'current', start, 0.)
+
+	if not quiet:
+		print('[{0}] {1}'.format(stage.name, ' '.join(stage.cmd)))
+
+	# each stage gets its own log, so that concurrent progress bars
+	# don't end up interleaved on the terminal
+
+	with open(os.path.join(logdir, stage.name + '.log'), 'w') as log:
+		status = subprocess.call(stage.cmd, stdout=log, stderr=subprocess.STDOUT)
+
+	elapsed = time.time() - start
+
+	if status != 0:
+		print('[{0}] failed with status {1}; see {2}'.format(stage.name, status,
+			os.path.join(logdir, stage.name + '.log')), file=sys.stderr)
+		return Timing(stage.name, 'failed', start, elapsed)
+
+	with open(stage.stamp(stampdir), 'w', encoding='utf_8') as f:
+		json.dump(stage.cmd, f)
+
+	if not quiet:
+		print('[{0}] done in {1:.1f}s'.format(stage.name, elapsed))
+
+	return Timing(stage.name, 'ok', start, elapsed)
+
+
+def run(stages, stampdir, logdir, jobs=None, force=False, quiet=False):
+	'''run every stage as soon as its dependencies have finished
+
+	Stages with no path between them in the graph run concurrently, up
+	to `jobs` at a time.  If a stage fails, nothing further is started,
+	and the stages that depend on it are reported as skipped.
+	'''
+
+	by_name = check_graph(stages)
+
+	os.makedirs(stampdir, exist_ok=True)
+	os.makedirs(logdir, exist_ok=True)
+
+	pending = {s.name: set(s.deps) for s in stages}
+	done = set()
+	failed = False
+	timing = []
+
+	with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+		running = dict()
+
+		while running or (pending and not failed):
+			if not failed:
+				for n in [n for n in pending if pending[n] <= done]:
+					del pending[n]
+					fut = pool.submit(run_stage, by_name[n], stampdir, logdir,
+						force, quiet)
+					running[fut] = n
+
+			finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+			for fut in finished:
+				rec = fut.result()
+				del running[fut]
+				timing.append(rec)
+
+				if rec.status == 'failed':
+					failed = True
+				else:
+					done.add(rec.name)
+
+	for n in sorted(pending):
+		timing.append(Timing(n, 'skipped', None, 0.))
+
+	return timing
+
+
+def write_timing(timing, wall, filename=None):
+	'''print the per-stage timing summary, optionally save it as tsv'''
+
+	rows = [(t.name, t.status, '{0:.2f}'.format(t.elapsed)) for t in timing]
+	rows.append(('total (wall clock)', '', '{0:.2f}'.format(wall)))
+
+	width = max(len(r[0]) for r in rows)
+
+	for r in rows:
+		print('{0:<{w}}  {1:<8} {2:>10}'.format(*r, w=width))
+
+	if filename is not None:
+		with open(filename, 'w', encoding='utf_8') as f:
+			f.write('stage\tstatus\tseconds\n')
+			for r in rows:
+				f.write('\t'.join(r) + '\n')
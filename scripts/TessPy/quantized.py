@@ -0,0 +1,107 @@
+'''int8 index of lsi vectors, for approximate scoring with exact re-ranking'''
+
+import numpy as np
+from gensim import matutils
+
+
+def quantize(x):
+	'''int8 codes and a scale for each row, so that x ~ codes * scale'''
+
+	scales = np.abs(x).max(axis=1) / 127
+	scales[scales == 0] = 1
+
+	codes = np.rint(x / scales[:, None]).astype(np.int8)
+
+	return codes, scales.astype(np.float32)
+
+
+class QuantizedIndex:
+	'''Cosine similarity against candidate vectors held as int8
+
+	Each normalized candidate vector is kept in memory as int8 codes with
+	one float scale, a quarter of the size of float32.  The float32
+	vectors are written to `filename` and memory-mapped, so only the rows
+	needed to re-rank a shortlist exactly are ever read back.
+
+	Calling the index gives approximate scores for a block of queries;
+	correction() gives what must be added to some of them to make them
+	exact.
+	'''
+
+	def __init__(self, vectors, n_topics, cand_ids, filename, chunk=1<<16):
+		self.vectors = vectors
+		self.n_topics = n_topics
+		self.chunk = chunk
+
+		exact = np.lib.format.open_memmap(filename, mode='w+',
+			dtype=np.float32, shape=(len(cand_ids), n_topics))
+
+		self.codes = np.empty((len(cand_ids), n_topics), dtype=np.int8)
+		self.scales = np.empty(len(cand_ids), dtype=np.float32)
+
+		# a chunk at a time, so the float vectors are never all in memory
+
+		for i in range(0, len(cand_ids), chunk):
+			dense = self.dense(cand_ids[i:i + chunk])
+			exact[i:i + chunk] = dense
+			self.codes[i:i + chunk], self.scales[i:i + chunk] = quantize(dense)
+
+		exact.flush()
+		del exact
+
+		self.exact = np.load(filename, mmap_mode='r')
+
+	def dense(self, ids):
+		'''unit-length float32 vectors for the given documents, one per row'''
+
+		dense = matutils.corpus2dense([self.vectors[i] for i in ids],
+			self.n_topics, num_docs=len(ids)).T
+
+		norms = np.sqrt((dense * dense).sum(axis=1))
+		norms[norms == 0] = 1
+
+		return (dense / norms[:, None]).astype(np.float32)
+
+	def nbytes(self):
+		'''memory taken by the index, and what float32 vectors would take'''
+
+		return self.codes.nbytes + self.scales.nbytes, self.exact.size * 4
+
+	def __call__(self, q_ids):
+		'''(queries x candidates) block of approximate scores'''
+
+		codes, scales = quantize(self.dense(q_ids))
+
+		# products of int8 codes summed over the topics are integers well
+		# inside float32's 24 bits of precision, so converting a chunk of
+		# codes to float and using BLAS still does integer arithmetic
+		# exactly, only much faster than numpy's integer matmul
+
+		q = codes.astype(np.float32)
+		block = np.empty((len(q_ids), len(self.codes)), dtype=np.float32)
+
+		for i in range(0, len(self.codes), self.chunk):
+			block[:, i:i + self.chunk] = q.dot(
+				self.codes[i:i + self.chunk].astype(np.float32).T)
+
+		block *= scales[:, None]
+		block *= self.scales[None, :]
+
+		return block
+
+	def correction(self, q_ids, top):
+		'''exact minus approximate score at candidate positions top, a
+		(queries x M) array'''
+
+		dense = self.dense(q_ids)
+		codes, scales = quantize(dense)
+
+		exact = np.einsum('qt,qmt->qm', dense, self.exact[top.ravel()].reshape(
+			top.shape + (self.n_topics,)))
+
+		approx = np.einsum('qt,qmt->qm', codes.astype(np.float32),
+			self.codes[top].astype(np.float32))
+		approx *= scales[:, None]
+		approx *= self.scales[top]
+
+		return exact - approx
@@ -0,0 +1,103 @@
+'''frequency-rank features from the Tesserae stoplists, and score penalties'''
+
+import re
+
+import numpy as np
+
+from TessPy import tesslang
+
+header = re.compile(r'#\s+count:\s+(\d+)')
+row = re.compile(r'^([^\t\n]+)\t(\d+)', re.M)
+number = re.compile(r'[0-9]')
+
+
+def read_stoplist(filename, lang):
+	'''read a stem frequency file; return lemmata, counts and total tokens
+
+	Lemmata are standardized and stripped of homograph numbers.  Counts
+	come back as a float array in file order, i.e. by descending frequency.
+	'''
+
+	with open(filename, 'r', encoding='utf_8') as f:
+		text = f.read()
+
+	m = header.match(text)
+
+	if m is None:
+		raise ValueError("Can't find header in {0}".format(filename))
+
+	rows = row.findall(text, m.end())
+
+	lemmata = [number.sub('', l)
+		for l in tesslang.standardize_many(lang, [r[0] for r in rows])]
+	counts = np.array([r[1] for r in rows], dtype=np.float64)
+
+	return lemmata, counts, int(m.group(1))
+
+
+class Ranks:
+	'''log rank and log frequency of each lemma, NaN where not on the stoplists
+
+	Where standardization folds several stoplist entries together, the
+	last one wins, as it always has.
+	'''
+
+	def __init__(self, lems, stoplists):
+		log_rank = dict()
+		log_freq = dict()
+
+		for filename, lang in stoplists:
+			lemmata, counts, total = read_stoplist(filename, lang)
+
+			log_rank.update(zip(lemmata, np.log(np.arange(1, len(lemmata) + 1))))
+			log_freq.update(zip(lemmata, np.log(counts / total)))
+
+		self.log_rank = np.array([log_rank.get(l, np.nan) for l in lems],
+			dtype=np.float32)
+		self.log_freq = np.array([log_freq.get(l, np.nan) for l in lems],
+			dtype=np.float32)
+
+	def known(self):
+		'''boolean mask of lemmata that appear on the stoplists'''
+
+		return ~np.isnan(self.log_rank)
+
+
+#
+# penalty functions: each takes the query and candidate feature values
+# as a column and a row, and returns a (queries x candidates) block
+#
+
+def penalty_rank(ranks, q_ids, c_ids):
+	'''absolute difference in log rank'''
+
+	return np.abs(ranks.log_rank[q_ids, None] - ranks.log_rank[None, c_ids])
+
+
+def penalty_freq(ranks, q_ids, c_ids):
+	'''absolute log of the ratio of the two words' frequencies'''
+
+	return np.abs(ranks.log_freq[q_ids, None] - ranks.log_freq[None, c_ids])
+
+
+penalties = {
+	'rank': penalty_rank,
+	'freq': penalty_freq,
+	'none': None
+}
+
+
+def penalize(sims, ranks, q_ids, c_ids, kind='rank', weight=1.):
+	'''subtract the weighted penalty from a block of scores, in place
+
+	The penalty is never negative, whatever the sign of weight.
+	'''
+
+	func = penalties[kind]
+
+	if func is None or weight == 0:
+		return sims
+
+	sims -= np.float32(abs(weight)) * func(ranks, q_ids, c_ids)
+
+	return sims
@@ -0,0 +1,42 @@
+'''inverted term index for scoring a few queries against many documents'''
+
+import numpy as np
+import scipy.sparse
+from gensim import matutils
+
+
+class TermIndex:
+	'''Cosine similarity by way of an inverted index over sparse vectors
+
+	The candidates' vectors are stored term-major, i.e. as a list of the
+	candidates containing each term, so a query's scores are accumulated
+	only over the candidates that share at least one term with it.
+	'''
+
+	def __init__(self, vectors, cand_ids):
+		if hasattr(vectors, 'matrix'):
+			docs = vectors.matrix.astype(np.float32)
+		else:
+			docs = matutils.corpus2csc(vectors, dtype=np.float32).T.tocsr()
+
+		# normalize rows so that dot products are cosines
+
+		norms = np.sqrt(np.asarray(docs.multiply(docs).sum(axis=1)).ravel())
+		norms[norms == 0] = 1
+		docs = scipy.sparse.diags(1 / norms).dot(docs).tocsr()
+
+		self.docs = docs
+		self.terms = docs[cand_ids].T.tocsr()
+
+	def shared(self, q_ids):
+		'''sparse (queries x candidates) scores, nonzero only where the
+		query and candidate have a term in common'''
+
+		return self.docs[q_ids].dot(self.terms).tocsr()
+
+	def __call__(self, q_ids):
+		'''dense block of scores, the same as the full similarity index
+		gives; candidates with no terms in common score 0, and may still
+		be chosen once penalties and transliteration bonuses are added'''
+
+		return self.shared(q_ids).toarray()
@@ -58,7 +58,27 @@ import os.path
 import sys
 import re
 
-fs, url, lib = read_config(os.path.join(os.path.dirname(__file__), '..', 'tesserae.conf'))
+_config = None
 
-for l in lib:
-	sys.path.append(l)
+
+def config():
+	'''read tesserae.conf the first time it's needed, extending sys.path'''
+	
+	global _config
+	
+	if _config is None:
+		_config = read_config(os.path.join(os.path.dirname(__file__), '..', 'tesserae.conf'))
+		
+		for l in _config[2]:
+			sys.path.append(l)
+	
+	return _config
+
+
+def __getattr__(name):
+	'''look up fs, url and lib lazily, so importing this module is cheap'''
+	
+	if name in ('fs', 'url', 'lib'):
+		return dict(zip(('fs', 'url', 'lib'), config()))[name]
+	
+	raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
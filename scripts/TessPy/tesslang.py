@@ -3,8 +3,11 @@
 import re
 import unicodedata
 
-def beta_to_uni(beta):
-	code = [		
+#
+# betacode to unicode substitutions, applied in order
+#
+
+_beta_code = [(re.compile(pat), sub) for pat, sub in [
 		(r'\)', "\u0313"),
 		(r'\(', "\u0314"),
 		(r'\/', "\u0301"),
@@ -38,22 +41,92 @@ def beta_to_uni(beta):
 		(r'\*x', 'Χ'),	(r'x', 'χ'),
 		(r'\*y', 'Ψ'),	(r'y', 'ψ'),
 		(r'\*w', 'Ω'),	(r'w', 'ω')
-	]
-	
-	caps_adj = re.compile(r'(\*)([^a-z ]+)')
+]]
+
+_caps_adj = re.compile(r'(\*)([^a-z ]+)')
+
+
+def beta_to_uni(beta):
+	'''Convert betacode to unicode greek'''
 	
-	beta = caps_adj.sub(r'\2\1', beta)
+	beta = _caps_adj.sub(r'\2\1', beta)
 	
-	for t in code:
-		pat, sub = t
-		
-		pat = re.compile(pat)
-		
+	for pat, sub in _beta_code:
 		beta = pat.sub(sub, beta)
 	
 	return beta
 
 
+#
+# rough rules for spelling greek words in latin letters, after
+# scripts/transliterate.pl; upper-case letters mark ambiguous sounds
+# which are expanded to all their possible spellings at the end
+#
+
+_translit_rules = [(re.compile(pat), sub) for pat, sub in [
+		# 2nd decl nominative endings
+		(r'ος$', 'Os'),
+		(r'ον$', 'On'),
+		(r'οι$', 'i'),
+		# diphthongs
+		(r'αι', 'ae'),
+		(r'ει', 'E'),
+		(r'οι', 'oe'),
+		# nasal gamma
+		(r'γ(?=[γκξχ])', 'n'),
+		# double consonants
+		(r'θ', 'th'),
+		(r'φ', 'ph'),
+		(r'χ', 'ch'),
+		(r'ψ', 'ps')
+]]
+
+_translit_letters = str.maketrans(
+		'αβγδεζηικλμνξοπρσςτυω',
+		'abgdezHiKlmnxoprsstYo')
+
+_translit_ambiguous = {
+		'H': ('e', 'a'),
+		'E': ('ei', 'e'),
+		'K': ('k', 'c'),
+		'Y': ('u', 'y'),
+		'O': ('u', 'o')
+}
+
+
+def greek_to_latin(lemma):
+	'''Guess at latin spellings of a greek word; returns all variants'''
+	
+	lemma = unicodedata.normalize('NFKD', lemma)
+	
+	# rough breathing
+	
+	if '\u0314' in lemma:
+		lemma = 'h' + lemma
+	
+	# strip all other accents
+	
+	lemma = ''.join(c for c in lemma if c.isalpha())
+	
+	# now exchange characters
+	
+	for pat, sub in _translit_rules:
+		lemma = pat.sub(sub, lemma)
+	
+	lemma = lemma.translate(_translit_letters)
+	lemma = lemma.replace('hr', 'rh', 1)
+	
+	# allow multiple guesses in case of ambiguous letters
+	
+	results = ['']
+	
+	for c in lemma:
+		results = [r + alt for r in results
+			for alt in _translit_ambiguous.get(c, (c,))]
+	
+	return results
+
+
 def standardize(lang, lemma):
 	'''Standardize orthography of greek and latin words'''
 
@@ -69,3 +142,30 @@ def standardize(lang, lemma):
 	lemma = lemma.lower()	
 
 	return(lemma)
+
+
+def standardize_many(lang, lemmata, cache=None):
+	'''Standardize an iterable of words, returning a list in input order
+	
+	Each distinct form is only standardized once.  Pass the same dict as
+	`cache` to share that work across calls.  Pure-ASCII Latin and
+	English forms skip unicode normalization, which can't change them.
+	'''
+	
+	if cache is None:
+		cache = dict()
+	
+	lemmata = list(lemmata)
+	
+	for lemma in set(lemmata).difference(cache):
+		if lang != 'grc' and lemma.isascii():
+			if lang == 'la':
+				lemma_std = lemma.replace('j', 'i').replace('v', 'u')
+			else:
+				lemma_std = lemma
+			
+			cache[lemma] = lemma_std.lower()
+		else:
+			cache[lemma] = standardize(lang, lemma)
+	
+	return [cache[lemma] for lemma in lemmata]
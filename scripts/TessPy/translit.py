@@ -0,0 +1,84 @@
+'''find latin stems that look like transliterations of greek words'''
+
+import math
+from collections import defaultdict
+
+from TessPy import tesslang
+
+
+def ngrams(form, n=3):
+	'''the set of character n-grams in a word, with boundary markers'''
+
+	form = '^' + form + '$'
+
+	return frozenset(form[i:i+n] for i in range(max(len(form) - n + 1, 1)))
+
+
+class StemIndex:
+	'''Character n-gram index over a list of latin stems
+
+	Lookups only touch the postings of the rarest n-grams in the query
+	(enough of them that any stem scoring above the threshold must turn
+	up in at least one), so cost grows with the number of plausible
+	matches rather than with the size of the stem list.
+	'''
+
+	def __init__(self, stems, n=3, min_len=4):
+		self.n = n
+		self.min_len = min_len
+		self.stems = list(stems)
+		self.grams = [ngrams(s, n) for s in self.stems]
+		self.postings = defaultdict(list)
+
+		for i, grams in enumerate(self.grams):
+			if len(self.stems[i]) < min_len:
+				continue
+
+			for g in grams:
+				self.postings[g].append(i)
+
+	def search(self, form, min_score=0.75):
+		'''stems whose n-gram dice coefficient with form is at least min_score;
+		returns a dict of stem position to score'''
+
+		query = ngrams(form, self.n)
+
+		# a stem can only reach min_score if it shares at least this
+		# many n-grams with the query, so it must contain at least one
+		# of the query's (len - overlap + 1) rarest n-grams
+
+		overlap = math.ceil(min_score * len(query) / (2 - min_score))
+		rare = sorted(query, key=lambda g: len(self.postings.get(g, ())))
+		rare = rare[:max(len(query) - overlap + 1, 1)]
+
+		hits = dict()
+		seen = set()
+
+		for g in rare:
+			for i in self.postings.get(g, ()):
+				if i in seen:
+					continue
+
+				seen.add(i)
+
+				score = 2 * len(query & self.grams[i]) / (len(query) + len(self.grams[i]))
+
+				if score >= min_score:
+					hits[i] = score
+
+		return hits
+
+	def match(self, greek, min_score=0.75):
+		'''best score for each stem against any transliteration of a greek word'''
+
+		best = dict()
+
+		for form in tesslang.greek_to_latin(greek):
+			if len(form) < self.min_len:
+				continue
+
+			for i, score in self.search(form, min_score).items():
+				if score > best.get(i, 0):
+					best[i] = score
+
+		return best
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Build the translation dictionaries from start to finish
+
+Runs read-lexicon.py and sims-export.py as a graph of stages.  Stages that
+don't depend on one another (the Latin and Greek lexica, the stoplists, the
+two directions of export) run at the same time.  A stage is skipped if its
+outputs are newer than its inputs and were made with the same command line.
+
+A per-stage timing summary is printed at the end and saved alongside the
+stage logs.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from TessPy import pipeline
+
+# working directories on vagrant vm
+basedir = "/vagrant"
+tempdir = "/home/vagrant/dictionary-data"
+
+scriptdir = os.path.dirname(os.path.abspath(__file__))
+
+
+def script(name):
+    '''command prefix to run one of the scripts in this directory'''
+
+    return [sys.executable, os.path.join(scriptdir, name)]
+
+
+def temp(name):
+    '''path to an intermediate file in the working directory'''
+
+    return os.path.join(tempdir, name)
+
+
+def build_stages(opt):
+    '''describe the dictionary build as a graph of stages'''
+
+    read_lexicon = script('read-lexicon.py')
+    sims_export = script('sims-export.py')
+
+    stages = []
+
+    # the lexica and the stoplists can all be read independently
+
+    for lang in ['la', 'grc']:
+        stages.append(pipeline.Stage('lexicon-' + lang,
+            read_lexicon + ['--quiet', '--stage', 'parse', '--lang', lang],
+            inputs = [os.path.join(basedir, 'data', lang + '.lexicon.xml'),
+                read_lexicon[1]],
+            outputs = [temp('defs_full_' + lang + '.ndjson')]))
+
+    stages.append(pipeline.Stage('stoplist',
+        read_lexicon + ['--quiet', '--stage', 'stoplist'],
+        inputs = [os.path.join(basedir, 'data', lang + '.stem.freq')
+            for lang in ['la', 'grc']] + [read_lexicon[1]],
+        outputs = [temp('stems.json')]))
+
+    # the gensim corpus needs all three
+
+    cmd = read_lexicon + ['--quiet', '--stage', 'build']
+    if opt.stem:
+        cmd.append('--stem')
+    if opt.match:
+        cmd.append('--match')
+
+    stages.append(pipeline.Stage('corpus', cmd,
+        inputs = [temp('defs_full_la.ndjson'), temp('defs_full_grc.ndjson'),
+            temp('stems.json'), read_lexicon[1]],
+        outputs = [temp(f + '.json') for f in
+            ['defs_bow', 'lookup_word', 'lookup_id']],
+        deps = ['lexicon-la', 'lexicon-grc', 'stoplist']))
+
+    # then the two directions of export can go side by side
+
+    vectors = ['--min-df', opt.min_df, '--max-df', opt.max_df,
+        '--max-features', opt.max_features, '--hashing', opt.hashing,
+        '--quantize', opt.quantize]
+
+    if opt.stopwords:
+        vectors.append('--stopwords')
+
+    if opt.dedup:
+        vectors.append('--dedup')
+
+    if opt.min_score is not None:
+        vectors += ['--min-score', opt.min_score]
+
+    for q, c in [('greek', 'latin'), ('latin', 'greek')]:
+        output = os.path.join(opt.output, 'trans-{0}-{1}.csv'.format(q, c))
+
+        stages.append(pipeline.Stage('export-{0}-{1}'.format(q, c),
+            sims_export + ['--quiet', '--query', q, '--corpus', c,
+                '--output', output, '--results', opt.results,
+                '--weight', opt.weight, '--topics', opt.topics] + vectors,
+            inputs = [temp(f + '.json') for f in
+                ['defs_bow', 'lookup_word', 'lookup_id']] + [sims_export[1]],
+            outputs = [output],
+            deps = ['corpus']))
+
+    return stages
+
+
+def main():
+    #
+    # check for options
+    #
+
+    parser = argparse.ArgumentParser(
+        description='Build the translation dictionaries')
+    parser.add_argument('-o', '--output', metavar='DIR', type=str,
+        default=os.path.join(basedir, 'results'),
+        help = 'Directory for finished dictionaries')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=None,
+        help = 'Max number of stages to run at once; default is one per cpu')
+    parser.add_argument('-f', '--force', action='store_const', const=1,
+        help = 'Rebuild every stage, even if it appears to be up to date')
+    parser.add_argument('-s', '--stem', action='store_const', const=1,
+        help = 'Apply porter2 stemmer to definitions')
+    parser.add_argument('-m', '--match', action='store_const', const=1,
+        help = "Restrict candidates to Tesserae's stems")
+    parser.add_argument('-t', '--topics', metavar='N', type=int, default=0,
+        help = 'Reduce to N topics using LSI; 0=disabled')
+    parser.add_argument('--min-df', metavar='N', type=int, default=1,
+        help = 'Drop terms found in fewer than N definitions')
+    parser.add_argument('--max-df', metavar='F', type=float, default=1.0,
+        help = 'Drop terms found in more than fraction F of definitions')
+    parser.add_argument('--max-features', metavar='N', type=int, default=0,
+        help = 'Keep only the N most widespread terms; 0=no limit')
+    parser.add_argument('--stopwords', action='store_const', const=1,
+        help = 'Drop common english words from definitions')
+    parser.add_argument('--hashing', metavar='N', type=int, default=0,
+        help = 'Hash terms into N buckets in one pass; 0=use a dictionary')
+    parser.add_argument('--quantize', metavar='M', type=int, default=0,
+        help = 'With --topics, score int8 vectors, re-ranking the best M exactly')
+    parser.add_argument('--dedup', action='store_const', const=1,
+        help = 'Score identical definitions only once')
+    parser.add_argument('-r', '--results', metavar="N", type=int, default=2,
+        help = 'Max number of results to produce for each query')
+    parser.add_argument('--min-score', metavar="T", type=float, default=None,
+        help = 'Produce every result scoring at least T, up to --results')
+    parser.add_argument('-w', '--weight', metavar="F", type=float, default=0,
+        help = 'Weight scores by inverse log-rank, coefficient F')
+    parser.add_argument('--quiet', action='store_const', const=1,
+        help = "Don't print status messages")
+
+    opt = parser.parse_args()
+
+    os.makedirs(opt.output, exist_ok=True)
+    os.makedirs(tempdir, exist_ok=True)
+
+    logdir = temp('logs')
+
+    try:
+        stages = build_stages(opt)
+
+        start = time.time()
+        timing = pipeline.run(stages, stampdir=temp('stamps'), logdir=logdir,
+            jobs=opt.jobs, force=opt.force, quiet=opt.quiet)
+        wall = time.time() - start
+    except ValueError as err:
+        print("Can't run pipeline: {0}".format(str(err)))
+        sys.exit(1)
+
+    pipeline.write_timing(timing, wall, os.path.join(logdir, 'timing.tsv'))
+
+    if any(t.status in ('failed', 'skipped') for t in timing):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,81 +17,21 @@ import codecs
 import json
 import argparse
 import unicodedata
-from progressbar import ProgressBar
 
-from TessPy.tesserae import fs, url
 from TessPy import tesslang
+from TessPy import lexicon
+from TessPy.lexicon import pat, clean_head, clean_entry
 
-from stemming.porter2 import stem
+# progressbar and the porter2 stemmer are imported by the functions that
+# use them, so that --help and the lighter stages start quickly
 
 basedir = "/vagrant"
 tempdir = "/home/vagrant/dictionary-data"
 
-#
-# a collection of compiled regular expressions
-#
-
-class pat:
-	'''Useful regular expressions'''
-	
-	# lexicon entry
-	
-	entry = re.compile(r'<entryFree [^>]*key="(.+?)"[^>]*>(.+?)</entryFree>')
-	
-	# XML nodes to omit
-	
-	stop = [
-		re.compile(pat) for pat in [
-			r'<cit>.*?</cit>',
-			r'<bibl .+?>.*?</bibl>',
-			r'<orth .+?>.*?</orth>',
-			r'<etym .+?>.*?</etym>',
-			r'<itype .+?>.*?</itype>',
-			r'<pos .+?>.*?</pos>',
-			r'<number .+?>.*?</number>',
-			r'<gen .+?>.*?</gen>',
-			r'<mood .+?>.*?</mood>',
-			r'<case .+?>.*?</case>',
-			r'<tns .+?>.*?</tns>',
-			r'<per .+?>.*?</per>',
-			r'<pron .+?>.*?</pron>',
-			r'<date>.*?</date>',
-			r'<usg .+?>.*?</usg>',
-			r'<gramGrp .+?>.*?</gramGrp>'
-		]
-	]
-	
-	# language-specific regular expressions matching the parts of
-	# dictionary entries that are English definitions of the headword
-	
-	definition = {
-		'la': re.compile(r'<hi [^>]*rend="ital"[^>]*>(.+?)</hi>'),
-		'grc': re.compile(r'<tr\b[^>]*>(.+?)</tr>')
-	}
-	
-	# betacode greek tag
-	# note that both dictionaries use <foreign lang="greek">
-	# while neither uses <foreign> for any other language
-	# (inside definitions, anyway)
-	
-	foreign = re.compile(r'<foreign lang="greek">(.+?)</foreign>')
-	
-	# stuff to remove from english entries
-	
-	clean = {
-		'any': re.compile(r'\W+'),
-		'la': re.compile(r'[^a-z]'),
-		'grc': re.compile(r'[\^_]')
-	}
-	
-	number = re.compile(r'[0-9]')
-
-
-def mo_beta2uni(mo):
-	'''A wrapper for tesslang.beta_to_uni that takes match objects'''
-	
-	return tesslang.beta_to_uni(mo.group(1))
+# json.dumps builds a new encoder for every call with non-default options,
+# which adds up over a stream of records; share one instead
 
+to_json = json.JSONEncoder(ensure_ascii=False).encode
 
 def write_dict(defs, name, quiet):
 	'''Save a copy of the dictionary in json format'''
@@ -119,111 +59,205 @@ def read_dict(name, quiet):
 	return defs
 
 
-def parse_XML_dictionaries(langs, quiet):
-    '''Create a dictionary of english translations for each lemma'''
+def write_ndjson(records, name, quiet):
+	'''Save a stream of records, one json array per line; returns the count'''
+	
+	n = 0
+	
+	with open(os.path.join(tempdir, name + '.ndjson'), 'w', encoding="utf_8") as f:
+		if not quiet:
+			print("Saving records to {0}".format(f.name))
+		
+		for rec in records:
+			f.write(to_json(rec) + '\n')
+			n += 1
+	
+	return n
+
+
+def read_ndjson(name, quiet):
+	'''Read back records saved by write_ndjson, one at a time'''
+	
+	with open(os.path.join(tempdir, name + '.ndjson'), 'r', encoding="utf_8") as f:
+		if not quiet:
+			print("Loading records from {0}".format(f.name))
+		
+		for line in f:
+			yield json.loads(line)
+
+
+def tee_ndjson(records, name, quiet):
+	'''Save a copy of a stream of records as it passes through'''
+	
+	with open(os.path.join(tempdir, name + '.ndjson'), 'w', encoding="utf_8") as f:
+		if not quiet:
+			print("Saving records to {0}".format(f.name))
+		
+		for rec in records:
+			f.write(to_json(rec) + '\n')
+			yield rec
+
+
+class JSONStream:
+	'''Write a json list (or object, given pairs) an item at a time,
+	laid out exactly as json.dump would have done it'''
+	
+	def __init__(self, name, quiet, pairs=False):
+		self.f = open(os.path.join(tempdir, name + '.json'), 'w', encoding="utf_8")
+		self.pairs = pairs
+		self.sep = ''
+		
+		if not quiet:
+			print("Saving {0}".format(self.f.name))
+		
+		self.f.write('{' if pairs else '[')
+	
+	def write(self, item):
+		'''add an item, or a (key, value) pair, already encoded as json'''
+		
+		if self.pairs:
+			item = item[0] + ': ' + item[1]
+		
+		self.f.write(self.sep + item)
+		self.sep = ', '
+	
+	def close(self):
+		self.f.write('}' if self.pairs else ']')
+		self.f.close()
+
+
+def batches(items, size):
+	'''group a stream into lists of up to size items'''
+	
+	batch = []
+	
+	for item in items:
+		batch.append(item)
+		
+		if len(batch) == size:
+			yield batch
+			batch = []
+	
+	if batch:
+		yield batch
+
+
+def read_entries(lang, quiet):
+    '''Extract the raw headword and English definitions of each entry in
+    one lexicon'''
     
-    defs = dict()
+    from progressbar import ProgressBar
     
-    # process latin, greek lexica in turn
+    filename = os.path.join(basedir, 'data', lang + '.lexicon.xml')
     
-    for lang in langs:
-        filename = os.path.join(basedir, 'data', lang + '.lexicon.xml')
+    if not quiet:
+        print('Reading lexicon {0}'.format(filename))
+    
+    pr = ProgressBar(maxval = os.stat(filename).st_size)
+    
+    try: 
+        f = open(filename, "r", encoding="utf_8")
+    except IOError as err:
+        print("Can't read {0}: {1}".format(filename, str(err)))
+        sys.exit(1)
+    
+    #
+    # Each line in the lexicon is one entry.
+    # Process one at a time to extract headword, definition.
+    #
+    
+    for line in f:
+        pr.update(pr.currval + len(line.encode('utf-8')))
         
-        if not quiet:
-            print('Reading lexicon {0}'.format(filename))
+        # skip lines that don't conform with the expected entry structure
         
-        pr = ProgressBar(maxval = os.stat(filename).st_size)
+        m = pat.entry.search(line)
         
-        try: 
-            f = open(filename, "r", encoding="utf_8")
-        except IOError as err:
-            print("Can't read {0}: {1}".format(filename, str(err)))
-            sys.exit(1)
+        if m is None:
+            continue
         
-        #
-        # Each line in the lexicon is one entry.
-        # Process one at a time to extract headword, definition.
-        #
+        lemma, entry = m.group(1, 2)
         
-        for line in f:
-            pr.update(pr.currval + len(line.encode('utf-8')))
-            
-            # skip lines that don't conform with the expected entry structure
-            
-            m = pat.entry.search(line)
-            
-            if m is None:
-                continue
-            
-            lemma, entry = m.group(1, 2)
-            
-            # standardize the headword
-            
-            lemma = pat.clean[lang].sub('', lemma)
-            lemma = pat.number.sub('', lemma)
-            lemma = tesslang.standardize(lang, lemma)
-            
-            # remove elements on the stoplist
-            
-            for stop in pat.stop:
-                entry = stop.sub('', entry)
-            
-            # transliterate betacode to unicode chars
-            # in foreign tags
-            
-            entry = pat.foreign.sub(mo_beta2uni, entry)
-            
-            # extract strings marked as translations of the headword
-            
-            def_strings = pat.definition[lang].findall(entry)
-            
-            # drop empty defs
-            
-            def_strings = [d for d in def_strings if not d.isspace()]
-            
-            # skip lemmata for which no translation can be extracted
-            
-            if def_strings is None:
-                continue
-            
-            if lemma in defs and defs[lemma] is not None:					
-                defs[lemma].extend(def_strings)
-            else:
-                defs[lemma] = def_strings
+        # clean the headword; it gets standardized later, along with
+        # a batch of others
         
-        pr.finish()
-    
-    if not quiet:
-        print('Read {0} entries'.format(len(defs)))
-        print('Flattening entries with multiple definitions')
+        yield clean_head(lang, lemma), clean_entry(lang, entry)
     
-    pr = ProgressBar(maxval = len(defs))
+    pr.finish()
+    f.close()
+
+
+def parse_XML_dictionaries(langs, quiet):
+    '''Stream (headword, list of english translations) for each entry in
+    the lexica, in order'''
     
-    empty_keys = set()
+    # headwords are standardized in batches, which is much quicker than
+    # one at a time; the cache carries across batches
     
-    for lemma in defs:
-        pr.update(pr.currval + 1)
-        
-        if defs[lemma] is None or defs[lemma] == []:
-            empty_keys.add(lemma)
-            continue
+    for lang in langs:
+        cache = dict()
         
-        defs[lemma] = '; '.join(defs[lemma])
+        for batch in batches(read_entries(lang, quiet), 10000):
+            heads = tesslang.standardize_many(lang, [b[0] for b in batch], cache)
+            
+            for lemma, (raw, def_strings) in zip(heads, batch):
+                yield lemma, def_strings
+
+
+def join_entries(entries, name, quiet):
+    '''Merge the definitions of headwords with more than one entry
     
-    pr.finish()
+    Takes (headword, list of definitions) and yields (headword, definitions
+    joined in one string), in order of first appearance, leaving out those
+    with no definitions at all.  The entries are spilled to name.ndjson
+    on the way through, and only the positions of each headword's entries
+    are kept in memory; the file is removed once they've been read back.
+    '''
     
-    if not quiet:
-        print('Lost {0} empty definitions'.format(len(empty_keys)))
+    where = dict()
+    
+    filename = os.path.join(tempdir, name + '.ndjson')
     
-    for k in empty_keys:
-        del defs[k]
+    try:
+        with open(filename, 'w+b') as f:
+            for lemma, def_strings in entries:
+                offsets = where.setdefault(lemma, [])
+                
+                if def_strings:
+                    offsets.append(f.tell())
+                    f.write(to_json(def_strings).encode('utf_8') + b'\n')
+            
+            if not quiet:
+                print('Read {0} entries'.format(len(where)))
+                print('Flattening entries with multiple definitions')
+            
+            empty = 0
+            
+            for lemma, offsets in where.items():
+                if not offsets or lemma == "":
+                    empty += 1
+                    continue
+                
+                def_strings = []
+                
+                for offset in offsets:
+                    f.seek(offset)
+                    def_strings.extend(json.loads(f.readline().decode('utf_8')))
+                
+                yield lemma, '; '.join(def_strings)
+    finally:
+        # the spill is as big as the lexica; don't leave it lying around
+        os.remove(filename)
     
-    return(defs)
+    if not quiet:
+        print('Lost {0} empty definitions'.format(empty))
 
 
 def parse_stop_list(lang, name, quiet):
     '''read frequency table'''
     
+    from progressbar import ProgressBar
+    
     # open stoplist file
     
     filename = None
@@ -260,123 +294,179 @@ def parse_stop_list(lang, name, quiet):
     
     # read the individual token counts, divide by total
     
-    freq = dict()
+    lemmata = []
+    counts = []
     
     for line in f:
         
         lemma, count = line.split('\t')
         
-        lemma = tesslang.standardize(lang, lemma)
-        lemma = pat.number.sub('', lemma)
-        
-        freq[lemma] = float(count)/total
+        lemmata.append(lemma)
+        counts.append(count)
         
         pr.update(pr.currval + len(line.encode('utf-8')))
         
     pr.finish()
+    f.close()
     
-    return(freq)
-
-
-def bag_of_words(defs, stem_flag, quiet):
-    '''convert dictionary definitions into bags of words'''
+    freq = dict()
     
-    # convert to bag of words, count words
+    for lemma, count in zip(tesslang.standardize_many(lang, lemmata), counts):
+        lemma = pat.number.sub('', lemma)
+        
+        freq[lemma] = float(count)/total
     
-    if not quiet:
-        print("Converting defs to bags of words")
+    return(freq)
+
+def tokenize(defs, stem_flag):
+    '''convert dictionary definitions into lists of words'''
     
-    count = {}
+    if stem_flag:
+        from stemming.porter2 import stem
     
-    pr = ProgressBar(maxval = len(defs))
+    # words recur across many definitions; share standardized forms
     
-    empty_keys = set()
+    std_cache = dict()
     
-    for lemma in defs:
-        pr.update(pr.currval + 1)
-                
-        defs[lemma] = [tesslang.standardize('any', w) 
-            for w in pat.clean['any'].split(defs[lemma]) 
-            if not w.isspace() and w != '']
+    for lemma, text in defs:
+        words = tesslang.standardize_many('any',
+            [w for w in pat.clean['any'].split(text)
+                if not w.isspace() and w != ''],
+            std_cache)
         
         if stem_flag:
-            defs[lemma] = [stem(w) for w in defs[lemma]]
+            words = [stem(w) for w in words]
         
-        if len(defs[lemma]) > 0:
-            for d in defs[lemma]:
-                if d in count:
-                    count[d] += 1
-                else:
-                    count[d] = 1
-        else:
-            empty_keys.add(lemma)    
+        yield lemma, words
+
+
+def remove_hapax(bags, name, quiet):
+    '''drop words that occur only once in the whole corpus
     
-    pr.finish()
+    This needs two passes: the first counts words while spilling the bags
+    to name.ndjson, the second reads them back and filters them, so only
+    the word counts are held in memory.  The file goes afterwards.
+    '''
+    
+    count = dict()
+    
+    def counted():
+        for lemma, words in bags:
+            for w in words:
+                count[w] = count.get(w, 0) + 1
+            
+            yield lemma, words
+    
+    total = write_ndjson(counted(), name, quiet)
     
     if not quiet:
         print("Removing hapax legomena")
     
-    pr = ProgressBar(maxval = len(defs))
+    kept = 0
     
-    for lemma in defs:
-        pr.update(pr.currval + 1)
-        
-        defs[lemma] = [w for w in defs[lemma] if count[w] > 1]
-        
-        if defs[lemma] == []:
-            empty_keys.add(lemma)
-	
-    pr.finish()
+    try:
+        for lemma, words in read_ndjson(name, True):
+            words = [w for w in words if count[w] > 1]
+            
+            if words:
+                kept += 1
+                yield lemma, words
+    finally:
+        os.remove(os.path.join(tempdir, name + '.ndjson'))
     
     if not quiet:
-        print('Lost {0} empty definitions'.format(len(empty_keys)))
-	
-    for k in empty_keys:
-        del defs[k]
+        print('Lost {0} empty definitions'.format(total - kept))
+
+
+def bag_of_words(defs, stem_flag, quiet):
+    '''convert dictionary definitions into bags of words'''
+    
+    if not quiet:
+        print("Converting defs to bags of words")
     
-    return(defs)
+    return remove_hapax(tokenize(defs, stem_flag), 'bags', quiet)
 
 
-def build_corpus(defs, quiet):
-    '''Create a "corpus" of the type expected by Gensim'''
+def write_corpus(bags, quiet):
+    '''Save a "corpus" of the type expected by Gensim, with look-up tables
+    by id and by headword; returns the number of headwords'''
     
     if not quiet:
-        print('Generating Gensim-style corpus')
+        print('Generating Gensim-style corpus and indices')
     
-    pr = ProgressBar(maxval = len(defs))
+    corpus = JSONStream('defs_bow', quiet)
+    by_id = JSONStream('lookup_id', quiet)
+    by_word = JSONStream('lookup_word', quiet, pairs=True)
     
-    corpus = []
+    n = 0
     
-    for lemma in defs:
-       	pr.update(pr.currval + 1)
-       	
-       	corpus.append(defs[lemma])
+    for lemma, words in bags:
+        lemma = to_json(lemma)
+        
+        corpus.write(to_json(words))
+        by_id.write(lemma)
+        by_word.write((lemma, str(n)))
+        n += 1
     
-    pr.finish()
+    for stream in [corpus, by_id, by_word]:
+        stream.close()
+    
+    return n
+
+
+def read_stems(quiet):
+    '''read the latin and greek stoplists into a single frequency table'''
     
-    return(corpus)
+    return dict(parse_stop_list('la', '*', quiet), **parse_stop_list('grc', '*', quiet))
 
 
-def make_index(defs, quiet):
-    '''Create two look-up tables: one by id and one by headword'''
+def merge_dicts(langs, quiet):
+    '''stream the per-language dictionaries saved by the "parse" stage,
+    as entries to be joined again'''
+    
+    for lang in langs:
+        for lemma, d in read_ndjson('defs_full_' + lang, quiet):
+            yield lemma, [d]
+
+
+def index_lexica(langs, quiet):
+    '''write an index of the lexicon entries by headword'''
+    
+    filename = os.path.join(tempdir, 'lexicon.idx')
     
     if not quiet:
-        print('Creating indices')
+        print('Indexing lexica')
     
-    by_word = {}
-    by_id = []
+    n = lexicon.build_index([(lang, os.path.join(basedir, 'data', lang + '.lexicon.xml'))
+        for lang in langs], filename)
     
-    pr = ProgressBar(maxval = len(defs))
+    if not quiet:
+        print('Wrote {0} entries to {1}'.format(n, filename))
+
+
+def lookup(words, langs):
+    '''print the definitions of some headwords, read from the lexica
+    by way of the index'''
     
-    for lemma in defs:
-        pr.update(pr.currval + 1)
-        
-        by_id.append(lemma)
-        by_word[lemma] = len(by_id) - 1
+    filename = os.path.join(tempdir, 'lexicon.idx')
     
-    pr.finish()
+    try:
+        index = lexicon.LexiconIndex(filename)
+    except (IOError, ValueError) as err:
+        print("Can't read index: {0}".format(str(err)))
+        sys.exit(1)
+    
+    for word in words:
+        found = [e for e in index.entries(word)
+            if langs is None or e[0] in langs]
+        
+        if not found:
+            print('{0}: not found'.format(word))
+        
+        for lang, defs in found:
+            print('{0} [{1}]: {2}'.format(word, lang, '; '.join(defs)))
     
-    return (by_word, by_id)
+    index.close()
 
 
 def main():
@@ -394,64 +484,101 @@ def main():
    			help='Print less info')
     parser.add_argument('-m', '--match', action='store_const', const=1,
    			help = "Restrict candidates to Tesserae's stems")
+    parser.add_argument('--stage', type=str, default='all',
+            choices=['all', 'parse', 'stoplist', 'build', 'index'],
+            help = 'Do only part of the work: parse one lexicon, '
+                + 'read the stoplists, or build the corpus from '
+                + 'the output of the other two; or index the '
+                + 'entries by headword. Default is everything')
+    parser.add_argument('--lang', type=str, action='append',
+            choices=['la', 'grc'],
+            help = 'Lexicon to read at the parse stage; may be repeated')
+    parser.add_argument('--lookup', metavar='WORD', type=str, action='append',
+            help = 'Print the definitions of a headword using the index; '
+                + 'may be repeated')
     
     opt = parser.parse_args()
     quiet = opt.quiet
+    langs = opt.lang or ['la', 'grc']
+    
+    # make sure working directory exists; only a full run starts clean,
+    # since the partial stages may be running alongside one another,
+    # and --cache needs what's there
+    
+    if opt.lookup:
+        lookup(opt.lookup, opt.lang)
+        return
+    
+    if opt.stage == 'all' and not opt.cache:
+        if os.path.isdir(tempdir):
+            shutil.rmtree(tempdir)
+        os.makedirs(tempdir)
+    else:
+        os.makedirs(tempdir, exist_ok=True)
+    
+    #
+    # Each stage below is a generator, drawing entries from the one before
+    # as they're needed, so nothing holds the whole corpus in memory: at
+    # most one entry at a time, plus tables the size of the vocabulary.
+    # Where a step needs to see everything first (merging repeated
+    # headwords, counting hapax legomena) it spills to NDJSON in tempdir.
+    #
+    
+    if opt.stage == 'parse':
+        for lang in langs:
+            write_ndjson(join_entries(parse_XML_dictionaries([lang], opt.quiet),
+                'entries_' + lang, opt.quiet), 'defs_full_' + lang, opt.quiet)
+        return
+    
+    if opt.stage == 'stoplist':
+        write_dict(read_stems(opt.quiet), 'stems', opt.quiet)
+        return
+    
+    if opt.stage == 'index':
+        index_lexica(langs, opt.quiet)
+        return
     
-    # make sure working directory exists
-    if os.path.isdir(tempdir):
-        shutil.rmtree(tempdir)
-    os.makedirs(tempdir)
-
     #
     # read the dictionaries
     #
     
-    if opt.cache == 1:
-        defs = read_dict('defs_full', opt.quiet)
+    if opt.stage == 'build':
+        defs = join_entries(merge_dicts(langs, opt.quiet), 'entries', opt.quiet)
+    elif opt.cache == 1:
+        defs = read_ndjson('defs_full', opt.quiet)
     else:
-        defs = parse_XML_dictionaries(['la', 'grc'], opt.quiet)
+        defs = join_entries(parse_XML_dictionaries(langs, opt.quiet), 'entries', opt.quiet)
     
-    if "" in defs:
-        del defs[""]
+    # keep the full definitions, unless that's where they came from
     
-    write_dict(defs, 'defs_full', opt.quiet)
+    if opt.stage == 'build' or opt.cache != 1:
+        defs = tee_ndjson(defs, 'defs_full', opt.quiet)
     
     # convert to bag of words
     
-    defs = bag_of_words(defs, opt.stem, opt.quiet)
+    bags = bag_of_words(defs, opt.stem, opt.quiet)
     
     if opt.match:
         # read the Tesserae stoplist
         
-        freq = dict(parse_stop_list('la', '*', opt.quiet), **parse_stop_list('grc', '*', opt.quiet))
+        if opt.stage == 'build':
+            freq = read_dict('stems', opt.quiet)
+        else:
+            freq = read_stems(opt.quiet)
         
         # limit synonym dictionary to members of stem dictionary
         
         print('restricting synonym dictionary to extisting stem index')
         
-        lost_keys = []
-        
-        for lemma in defs:
-            if lemma not in freq:
-                lost_keys.append(lemma)
-        
-        for lemma in lost_keys:
-            del defs[lemma]
-        
-    if not opt.quiet:
-        print('{0} lemmas still have definitions'.format(len(defs)))
+        bags = ((lemma, words) for lemma, words in bags if lemma in freq)
     
-    # convert back into one string of defining words per lemma
+    # save the bags of words as a corpus, with by-word and by-id
+    # lookup tables
     
-    corpus = build_corpus(defs, opt.quiet)
-    write_dict(corpus, 'defs_bow', opt.quiet)
+    n = write_corpus(bags, opt.quiet)
     
-    # create and save by-word and by-id lookup tables
-    
-    by_word, by_id = make_index(defs, opt.quiet)
-    write_dict(by_word, 'lookup_word', opt.quiet)
-    write_dict(by_id, 'lookup_id', opt.quiet)
+    if not opt.quiet:
+        print('{0} lemmas still have definitions'.format(n))
 
 
 if __name__ == '__main__':
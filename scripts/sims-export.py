@@ -17,44 +17,31 @@ import codecs
 import unicodedata
 import argparse
 import re
-import numpy as np
-from progressbar import ProgressBar
+import math
+import time
+import hashlib
 
 from TessPy import tesslang
+from TessPy.translit import StemIndex
+from TessPy import lease
 
-from gensim import corpora, models, similarities
+# numpy, gensim and progressbar are slow to load, so they're imported
+# where they're used rather than here; that keeps --help and argument
+# errors quick
 
 # working directories on vagrant vm
 basedir = "/vagrant"
 tempdir = "/home/vagrant/dictionary-data"
 
-#
-# global variables
-#
-
-number = re.compile(r'[0-9]', re.U)
-
 #
 # functions
 #
 
-def load_ranks(lems, quiet):
-    '''get the word ranks from Tesserae stoplist'''
-    
-    dict_rank = dict(parse_stop_list('la', '*', quiet), **parse_stop_list('grc', '*', quiet))
-        
-    array_rank = np.array([None] * len(lems))
-    
-    for i,lem in enumerate(lems):
-        if lem in dict_rank:
-            array_rank[i] = dict_rank[lem]
-    
-    return array_rank
-
-
 def export_results(file, results, export_scores, quiet):
     '''write results to the output file'''
     
+    from progressbar import ProgressBar
+    
     file_output = open(file, 'w', encoding="utf_8")
     
     pr = ProgressBar(maxval = len(results))
@@ -81,85 +68,365 @@ def export_results(file, results, export_scores, quiet):
     pr.finish()
 
 
-def parse_stop_list(lang, name, quiet):
-    '''read frequency table'''
+def load_dict(filename, quiet):
+    '''load a dictionary previously saved with pickle'''
     
-    # open stoplist file
-    filename = None
+    file_dict = os.path.join(tempdir, filename)
     
-    if name == '*':
-        filename = os.path.join(basedir, "data", lang + '.stem.freq')
-    else:
-        filename = os.path.join(basedir, "data", name + '.freq_stop_stem')
-  
     if not quiet:
-        print('Reading stoplist {0}'.format(filename))
-  
-    pr = ProgressBar(maxval = os.stat(filename).st_size)
-  
-    try:
-        f = open(filename, "r", encoding="utf_8")
-    except IOError as err:
-        print("Can't read {0}: {1}".format(filename, str(err)))
-        sys.exit(1)
+        print('Reading ' + file_dict)
+    
+    f = open(file_dict, "r", encoding="utf_8")
     
-    # read stoplist header to get total token count
+    data = json.load(f)
     
-    head = f.readline()
+    f.close()
+    
+    return(data)
+
+
+def read_queries(filename, lang):
+    '''read a list of query words, one per line, and standardize them'''
     
-    m = re.compile('#\s+count:\s+(\d+)').match(head)
+    if filename == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(filename, 'r', encoding='utf_8') as f:
+            lines = f.read().splitlines()
     
-    if m is None:
-        print("Can't find header in {0}".format(filename))
-        sys.exit(1)
-      
-    total = int(m.group(1))
+    forms = [l.strip() for l in lines if l.strip() != '']
+    
+    return tesslang.standardize_many(lang, forms)
+
+
+def is_greek(form):
+    '''try to guess whether a word is greek'''
+    
+    for c in form:
+        if ord(c) > 255:
+            return(True)
+    
+    return(False)
+
+
+def prune_vocabulary(dictionary, opt):
+    '''drop stopwords, and terms in too few or too many definitions
+    
+    Very common words like "to" and "of" add little to tell definitions
+    apart, but make the vectors denser and every dot product slower.
+    '''
+    
+    if opt.stopwords:
+        from gensim.parsing.preprocessing import STOPWORDS
+    
+        dictionary.filter_tokens(bad_ids=[dictionary.token2id[w]
+            for w in STOPWORDS if w in dictionary.token2id])
+    
+    if opt.min_df > 1 or opt.max_df < 1 or opt.max_features > 0:
+        dictionary.filter_extremes(no_below=opt.min_df, no_above=opt.max_df,
+            keep_n=opt.max_features or None)
+
+
+def build_vectors(corpus, opt):
+    '''turn the bags of words into tf-idf or lsi vectors'''
+    
+    from gensim import corpora, models
+    
+    # create dictionary
+    
+    if not opt.quiet:
+        print('Creating dictionary')
+    
+    dictionary = corpora.Dictionary(corpus)
+    
+    n_terms, nnz = len(dictionary), dictionary.num_nnz
+    
+    prune_vocabulary(dictionary, opt)
+    
+    # convert each sample to a bag of words
+    
+    if not opt.quiet:
+        print('Converting each doc to bag-of-words')
+    
+    corpus = [dictionary.doc2bow(doc) for doc in corpus]
+    
+    if not opt.quiet and len(dictionary) < n_terms:
+        print('Pruned vocabulary from {0} to {1} terms, nonzeros from {2} to {3}'.format(
+            n_terms, len(dictionary), nnz, sum(len(doc) for doc in corpus)))
+    
+    # calculate tf-idf scores
+    
+    if not opt.quiet:
+        print('Creating tf-idf model')
+    
+    tfidf = models.TfidfModel(corpus)
+    
+    if not opt.quiet:
+        print('Transforming the corpus to tf-idf')
+    
+    corpus_tfidf = tfidf[corpus]
+        
+    # perform lsi transformation
+    
+    corpus_final = corpus_tfidf
+    
+    if opt.topics > 0:
+        if not opt.quiet:
+            print('Performing LSI with {0} topics'.format(opt.topics))
+    
+        lsi = models.LsiModel(corpus_tfidf, id2word=dictionary, num_topics=opt.topics)
+        
+        corpus_final = lsi[corpus_tfidf]
+    
+    # keep the transformed vectors, so queries can be drawn from them
+    
+    return list(corpus_final)
+
+
+def hash_vectors(file_corpus, opt):
+    '''tf-idf or lsi vectors from a single streaming pass over the corpus'''
     
-    pr.update(len(head.encode('utf_8')))
+    from TessPy import hashing
     
-    # read the individual token counts, divide by total
+    stopwords = ()
     
-    score = dict()
+    if opt.stopwords:
+        from gensim.parsing.preprocessing import STOPWORDS
+        stopwords = STOPWORDS
     
-    for n,line in enumerate(f):
-        lemma, count = line.split('\t')
+    if not opt.quiet:
+        print('Hashing {0} into {1} buckets'.format(file_corpus, opt.hashing))
+    
+    vectorizer = hashing.HashingVectorizer(opt.hashing, stopwords)
+    
+    matrix = vectorizer.transform(hashing.iter_json_list(file_corpus),
+        opt.min_df, opt.max_df, opt.max_features)
+    
+    if not opt.quiet:
+        print('{0} terms, {1} sharing a bucket with another; {2} nonzeros'.format(
+            vectorizer.terms, vectorizer.collisions, matrix.nnz))
+    
+    corpus_final = hashing.CsrCorpus(matrix)
+    
+    if opt.topics > 0:
+        from gensim import models
         
-        lemma = tesslang.standardize(lang, lemma)
-        lemma = number.sub('', lemma)
+        if not opt.quiet:
+            print('Performing LSI with {0} topics'.format(opt.topics))
         
-        score[lemma] = np.log(n+1)
+        lsi = models.LsiModel(corpus_final, num_topics=opt.topics)
         
-        pr.update(pr.currval + len(line.encode('utf_8')))
+        corpus_final = list(lsi[corpus_final])
     
-    f.close()
-    return score
+    return corpus_final
 
 
-def load_dict(filename, quiet):
-    '''load a dictionary previously saved with pickle'''
+def build_index(corpus_final, dir_calc, quiet):
+    '''index the vectors for similarity queries against the whole corpus'''
     
-    file_dict = os.path.join(tempdir, filename)
+    from gensim import similarities, utils
     
     if not quiet:
-        print('Reading ' + file_dict)
+        print('Calculating similarities (please be patient)')
     
-    f = open(file_dict, "r", encoding="utf_8")
+    num_features = len(corpus_final)
     
-    data = json.load(f)
+    # hashed vectors can have more buckets than there are documents, and
+    # once duplicates are merged there can be more terms than documents
+    if hasattr(corpus_final, 'matrix'):
+        num_features = max(num_features, corpus_final.matrix.shape[1])
+    else:
+        num_features = max(num_features, utils.get_max_id(corpus_final) + 1)
     
-    f.close()
+    return similarities.Similarity(dir_calc, corpus_final, num_features)
+
+
+def model_stamp(file_corpus, opt):
+    '''what a saved model has to match to be reused'''
     
-    return(data)
+    info = os.stat(file_corpus)
+    
+    return {'corpus': [info.st_size, info.st_mtime], 'topics': opt.topics,
+        'prune': [opt.min_df, opt.max_df, opt.max_features, opt.stopwords],
+        'hashing': opt.hashing, 'dedup': opt.dedup}
 
 
-def is_greek(form):
-    '''try to guess whether a word is greek'''
+def save_model(corpus_final, index, dir_calc, stamp, quiet):
+    '''save vectors and index (if there is one) beside the similarity shards'''
     
-    for c in form:
-        if ord(c) > 255:
-            return(True)
+    from gensim import utils
     
-    return(False)
+    if not quiet:
+        print('Saving model to {0}.*'.format(dir_calc))
+    
+    for ext in ['.model.json', '.index']:
+        if os.path.exists(dir_calc + ext):
+            os.remove(dir_calc + ext)
+    
+    utils.pickle(corpus_final, dir_calc + '.vectors')
+    
+    if index is not None:
+        index.save(dir_calc + '.index')
+    
+    # the stamp goes last, so it only exists once the rest is complete
+    
+    with open(dir_calc + '.model.json', 'w', encoding='utf_8') as f:
+        json.dump(stamp, f)
+
+
+def load_model(dir_calc, stamp, quiet):
+    '''load a model saved by an earlier run; None if there isn't a
+    matching one'''
+    
+    from gensim import utils, similarities
+    
+    try:
+        with open(dir_calc + '.model.json', 'r', encoding='utf_8') as f:
+            if json.load(f) != stamp:
+                if not quiet:
+                    print('Saved model is out of date; rebuilding')
+                return None
+        
+        if not quiet:
+            print('Loading model from {0}.*'.format(dir_calc))
+        
+        corpus_final = utils.unpickle(dir_calc + '.vectors')
+        index = None
+        
+        if os.path.exists(dir_calc + '.index'):
+            index = similarities.Similarity.load(dir_calc + '.index')
+    except (IOError, ValueError):
+        return None
+    
+    return corpus_final, index
+
+
+def score_blocks(similarity, by_id, blocks, cand_ids, rank, translit, columns, opt, pr):
+    '''score blocks of queries against the candidates, keeping the top hits
+    
+    blocks is a sequence of (block number, array of query ids), and
+    similarity(q_ids) returns a (queries x candidates) array.  Yields the
+    block number with arrays of query ids, candidate ids and scores.  If
+    columns is given, it also collects the best queries for each candidate.
+    '''
+    
+    import numpy as np
+    from TessPy import ranks, export
+    
+    for k, q_ids in blocks:
+        # similarity of each query to each candidate
+        block = similarity(q_ids)
+        
+        # a word can't be its own translation
+        pos = np.minimum(np.searchsorted(cand_ids, q_ids), len(cand_ids) - 1)
+        self_hit = cand_ids[pos] == q_ids
+        block[np.flatnonzero(self_hit), pos[self_hit]] = -np.inf
+        
+        # apply distribution difference metric
+        ranks.penalize(block, rank, q_ids, cand_ids, opt.penalty, opt.weight)
+        
+        # reward candidates that look like transliterations of the query
+        if translit is not None:
+            for i, q_id in enumerate(q_ids):
+                for j, score in translit.match(by_id[q_id]).items():
+                    block[i, j] += score * opt.translit
+        
+        # keep the best results for each query, and for each candidate
+        if opt.quantize > 0:
+            # the scores are approximate: take a shortlist, make its scores
+            # exact, and choose from that.  putting the shortlist back in
+            # candidate order first breaks ties the same way as usual
+            top, scores = export.top_hits(block, opt.quantize)
+            
+            order = np.argsort(top, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            scores = np.take_along_axis(scores, order, axis=1)
+            
+            scores += similarity.correction(q_ids, top)
+            
+            best, scores = export.top_hits(scores, opt.results)
+            top = np.take_along_axis(top, best, axis=1)
+        elif opt.min_score is not None:
+            # everything at or above the threshold, best first, up to
+            # --results of them unless that's 0
+            n_pass = int((block >= opt.min_score).sum(axis=1).max(initial=0))
+            
+            if opt.results > 0:
+                n_pass = min(n_pass, opt.results)
+            
+            top, scores = export.top_hits(block, max(n_pass, 1))
+            scores[scores < opt.min_score] = -np.inf
+        else:
+            top, scores = export.top_hits(block, opt.results)
+        
+        if columns is not None:
+            columns.update(block, q_ids)
+        
+        pr.update(pr.currval + len(q_ids))
+        
+        yield k, q_ids, cand_ids[top], scores
+
+
+def format_block(block, names, sparse=False):
+    '''render a block of results as csv lines, encoded for output; if
+    sparse, leave out queries with no results'''
+    
+    k, q_ids, hits, scores = block
+    
+    lines = []
+    
+    for q_id, row_hits, row_scores in zip(q_ids.tolist(), hits.tolist(), scores.tolist()):
+        results = ["{0}:{1}".format(names[c], sim)
+            for c, sim in zip(row_hits, row_scores) if math.isfinite(sim)]
+        
+        if sparse and not results:
+            continue
+        
+        lines.append("{0},{1}\n".format(names[q_id], ",".join(results)))
+    
+    return k, "".join(lines).encode("utf_8")
+
+
+def prune_by_bounds(vectors, inverse, q_ids, cand_ids, opt):
+    '''drop queries and candidates that can't score --min-score with
+    anything on the other side'''
+    
+    import numpy as np
+    from TessPy import bounds
+    
+    # the transliteration bonus is all that can raise a score above
+    # the cosine; penalties only lower it
+    
+    reach = opt.min_score - max(opt.translit, 0)
+    
+    if inverse is None:
+        inverse = np.arange(len(vectors))
+    
+    # fewer candidates can mean lower bounds for the queries, and so on
+    
+    while True:
+        q_bound, c_bound = bounds.cosine_bounds(vectors, inverse[q_ids],
+            inverse[cand_ids])
+        
+        keep_q = q_bound >= reach
+        keep_c = c_bound >= reach
+        
+        if keep_q.all() and keep_c.all():
+            return q_ids, cand_ids
+        
+        q_ids, cand_ids = q_ids[keep_q], cand_ids[keep_c]
+
+
+def job_key(names, q_ids, cand_ids, opt):
+    '''a hash of everything that determines the output, so that work from
+    different jobs isn't mixed up'''
+    
+    job = [names, q_ids.tolist(), cand_ids.tolist(), opt.topics, opt.results,
+        opt.weight, opt.penalty, opt.translit, opt.block,
+        opt.min_df, opt.max_df, opt.max_features, opt.stopwords, opt.hashing,
+        opt.quantize, opt.dedup, opt.min_score]
+    
+    return hashlib.sha1(json.dumps(job, ensure_ascii=False).encode('utf_8')).hexdigest()
 
 
 def validate_arg_child(s):
@@ -202,17 +469,116 @@ def main():
         default="trans.csv", help = 'Destination file')
     parser.add_argument('-t', '--topics', metavar='N', type=int, default=0,
         help = 'Reduce to N topics using LSI; 0=disabled')
+    parser.add_argument('--min-df', metavar='N', type=int, default=1,
+        help = 'Drop terms found in fewer than N definitions. Default is 1')
+    parser.add_argument('--max-df', metavar='F', type=float, default=1.0,
+        help = 'Drop terms found in more than fraction F of definitions.'
+                + ' Default is 1, i.e. keep them all')
+    parser.add_argument('--max-features', metavar='N', type=int, default=0,
+        help = 'Keep only the N terms found in the most definitions;'
+                + ' 0=no limit')
+    parser.add_argument('--stopwords', action='store_const', const=1,
+        help = 'Drop common english words (gensim\'s stopword list)')
+    parser.add_argument('--hashing', metavar='N', type=int, default=0,
+        help = 'Build the tf-idf vectors in one streaming pass over the'
+                + ' corpus, hashing terms into N buckets; 0=disabled')
+    parser.add_argument('--quantize', metavar='M', type=int, default=0,
+        help = 'With --topics, score against int8 copies of the vectors'
+                + ' and re-rank the best M for each query exactly; 0=disabled')
+    parser.add_argument('--dedup', action='store_const', const=1,
+        help = 'Score headwords with identical definition vectors only once')
     parser.add_argument('-r', '--results', metavar="N", type=int, default=2,
         help = 'Max number of results to produce for each query')
+    parser.add_argument('--min-score', metavar="T", type=float, default=None,
+        help = 'Produce every result scoring at least T, up to --results'
+                + ' of them (0=no limit); leave out queries with none')
     parser.add_argument('-w', '--weight', metavar="F", type=float, default=0,
         help = 'Weight scores by inverse log-rank, coefficient F.'
                 + ' Suggested range 0-1. Default is no weighting')
+    parser.add_argument('-p', '--penalty', type=str, default='rank',
+        choices=['rank', 'freq', 'none'],
+        help = 'What --weight penalizes: difference in log rank (default),'
+                + ' log ratio of frequencies, or nothing')
+    parser.add_argument('--block', metavar='N', type=int, default=256,
+        help = 'Number of queries to score at once. Default is 256')
+    parser.add_argument('--translit', metavar="F", type=float, default=0,
+        help = 'Add F times the transliteration match score (0-1) to latin'
+                + ' candidates spelled like the greek query. Default is 0')
+    parser.add_argument('--queries', metavar="FILE", type=str, default=None,
+        help = "Only translate the headwords listed in FILE, one per line;"
+                + " - reads them from stdin")
+    parser.add_argument('--reverse', metavar="FILE", type=str, default=None,
+        help = "Also write translations in the opposite direction to FILE,"
+                + " from the same similarity calculations")
+    parser.add_argument('--mnn', action='store_const', const=1,
+        help = "Keep only mutual nearest neighbours: pairs where each is"
+                + " among the other's top --results")
     parser.add_argument('--child', metavar="I:N", type=validate_arg_child,
         default = None, help = "This is child I of N, only do part of the work")
+    parser.add_argument('--shared', metavar="DIR", type=str, default=None,
+        help = "Share the work with other nodes through directory DIR,"
+                + " which all of them can write to")
+    parser.add_argument('--lease', metavar="SECS", type=int, default=600,
+        help = "With --shared, take over blocks whose worker has been"
+                + " silent for SECS seconds. Default is 600")
+    parser.add_argument('--merge', action='store_const', const=1,
+        help = "With --shared, just put the finished blocks together"
+                + " into --output")
+    parser.add_argument('--checkpoint', metavar="SECS", type=int, default=300,
+        help = "Save progress every SECS seconds. Default is 300")
+    parser.add_argument('--resume', action='store_const', const=1,
+        help = "Reuse the saved model and carry on from the last checkpoint")
+    parser.add_argument('--benchmark', metavar="FILE", type=str, default=None,
+        help = "Afterwards, report the precision of the top hits against"
+                + " the validated pairs in FILE, e.g. data/dictionary-benchmark.csv")
     parser.add_argument('--quiet', action='store_const', const=1,
         help = "Don't print status messages to stderr")
     
     opt = parser.parse_args()
+    
+    if opt.shared is not None and opt.child is not None:
+        parser.error("--shared and --child can't be used together")
+    
+    if (opt.reverse is not None or opt.mnn) and (opt.child is not None
+            or opt.shared is not None or opt.queries is not None):
+        parser.error("--reverse and --mnn need every query, so they can't be"
+            + " combined with --child, --shared or --queries")
+    
+    if opt.min_score is not None and (opt.quantize > 0
+            or opt.reverse is not None or opt.mnn):
+        parser.error("--min-score can't be used with --quantize, --reverse or --mnn")
+    
+    if opt.min_score is None and opt.results < 1:
+        parser.error("--results must be at least 1")
+    
+    if opt.quantize > 0 and opt.topics == 0:
+        parser.error("--quantize needs --topics")
+    
+    if opt.quantize > 0 and opt.quantize < opt.results:
+        parser.error("--quantize must be at least --results")
+    
+    if opt.quantize > 0 and (opt.reverse is not None or opt.mnn):
+        parser.error("--quantize can't be used with --reverse or --mnn")
+    
+    if opt.merge and opt.shared is None:
+        parser.error("--merge needs --shared")
+    
+    # merging needs none of the heavy machinery
+    
+    if opt.merge:
+        try:
+            lease.SharedRun(opt.shared).merge(opt.output)
+        except (IOError, ValueError) as err:
+            print("Can't merge {0}: {1}".format(opt.shared, str(err)))
+            sys.exit(1)
+        return
+    
+    if opt.translit > 0 and (opt.query, opt.corpus) != ("greek", "latin"):
+        parser.error("--translit only works with --query greek --corpus latin")
+    
+    import numpy as np
+    from progressbar import ProgressBar
+    from TessPy import ranks, export, termindex, dedup
         
     #
     # load data created by read_lexicon.py
@@ -230,11 +596,6 @@ def main():
     
     file_corpus = os.path.join(tempdir, 'defs_bow.json')
     
-    if not opt.quiet:
-        print('Loading corpus ' + file_corpus)
-    
-    corpus = load_dict(file_corpus, opt.quiet)
-    
     #
     # use gensim to calculate similarities
     #
@@ -250,130 +611,314 @@ def main():
     # These appear to be always in order of decreasing score.
     #
     # Older versions of this script expected the list of tuples, but didn't 
-    # assume any order and re-ordered them by score. Now I've changed it to
-    # expect the numpy array. Note that thanks to numpy you can use the array
-    # like a vector in R. For example,
-    #   sims = sims[filter]
-    # subsets the sims array using another array, this time of boolean values.
-    # Likewise, 
-    #   sims -= np.absolute((rank[q_id] - rank[filter]) * opt.weight)
-    # Subtracts from every element of sims the difference between one specific
-    # rank, that of document q_id, and each element of array rank in turn.
-    # The arrays rank and sims, each subset by filter, have the same number of
-    # elements.
-    #
-    # I'm just writing this note to myself because I'm really new at this numpy
-    # stuff and I might forget what I've done here otherwise. Delete this if
-    # you like, later.
+    # assume any order and re-ordered them by score. Now it expects the numpy
+    # array, and goes one step further: it asks for a whole block of queries
+    # at once and gets back a 2-d array, one row per query. Then
+    #   block[:, cand_ids]
+    # keeps only the columns for candidate translations, and the frequency
+    # penalty in TessPy.ranks is subtracted from the entire block in a single
+    # broadcast operation: a column of query ranks against a row of candidate
+    # ranks gives a (queries x candidates) array of differences.
     
-    # create dictionary
+    # keep shards for different directions and children apart, so that
+    # several exports can run at the same time
     
-    if not opt.quiet:
-        print('Creating dictionary')
+    dir_calc = os.path.join(tempdir, 'sims-{0}-{1}'.format(opt.query, opt.corpus))
     
-    dictionary = corpora.Dictionary(corpus)
+    if opt.child is not None:
+        dir_calc += '-{0}'.format(opt.child[0])
     
-    # convert each sample to a bag of words
+    # reuse the model saved by an interrupted run if it matches this one
     
-    if not opt.quiet:
-        print('Converting each doc to bag-of-words')
+    stamp = model_stamp(file_corpus, opt)
+    model = None
+    fresh = False
     
-    corpus = [dictionary.doc2bow(doc) for doc in corpus]
+    if opt.resume:
+        model = load_model(dir_calc, stamp, opt.quiet)
     
-    # calculate tf-idf scores
+    if model is None and opt.hashing > 0:
+        model = (hash_vectors(file_corpus, opt), None)
+        fresh = True
     
-    if not opt.quiet:
-        print('Creating tf-idf model')
+    elif model is None:
+        if not opt.quiet:
+            print('Loading corpus ' + file_corpus)
+        
+        corpus = load_dict(file_corpus, opt.quiet)
+        
+        model = (build_vectors(corpus, opt), None)
+        fresh = True
     
-    tfidf = models.TfidfModel(corpus)
+    corpus_final, index = model
     
-    if not opt.quiet:
-        print('Transforming the corpus to tf-idf')
+    # headwords with identical vectors are scored once, as one; the
+    # similarity index only holds the distinct vectors
     
-    corpus_tfidf = tfidf[corpus]
+    vectors = corpus_final
+    inverse = None
+    
+    if opt.dedup:
+        first, inverse = dedup.unique_vectors(corpus_final)
+        vectors = dedup.select(corpus_final, first)
         
-    # perform lsi transformation
+        if not opt.quiet:
+            print('{0} distinct vectors among {1} headwords'.format(len(first),
+                len(corpus_final)))
     
-    corpus_final = corpus_tfidf
+    # a handful of tf-idf queries is quicker to score through an inverted
+    # index of the candidates than against the whole corpus
     
-    if opt.topics > 0:
+    use_terms = opt.queries is not None and opt.topics == 0
+    
+    if index is None and not (use_terms or opt.quantize > 0):
+        index = build_index(vectors, dir_calc, opt.quiet)
+        fresh = True
+    
+    if fresh:
+        save_model(corpus_final, index, dir_calc, stamp, opt.quiet)
+    
+    # consider frequency distribution
+    
+    try:
+        rank = ranks.Ranks(by_id,
+            [(os.path.join(basedir, 'data', lang + '.stem.freq'), lang)
+                for lang in ['la', 'grc']])
+    except (IOError, ValueError) as err:
+        print("Can't read stoplist: {0}".format(str(err)))
+        sys.exit(1)
+    
+    # only words on the stoplist can be queries or candidates
+    greek = np.array([is_greek(lem) for lem in by_id])
+    
+    filter = rank.known()
+    if (opt.corpus == "latin"):
+        filter = filter & np.invert(greek)
+    elif (opt.corpus == "greek"):
+        filter = filter & greek
+    
+    cand_ids = np.flatnonzero(filter)
+    
+    queries = rank.known()
+    if (opt.query == "latin"):
+        queries = queries & np.invert(greek)
+    elif (opt.query == "greek"):
+        queries = queries & greek
+    
+    # if child, only do every ith query
+    if opt.child is not None:
+        child_id, nchildren = opt.child
+        queries = queries & (np.arange(len(by_id)) % nchildren == child_id % nchildren)
+    
+    # restrict queries to a list of headwords
+    if opt.queries is not None:
+        try:
+            forms = read_queries(opt.queries, 'grc' if opt.query == 'greek' else 'la')
+        except IOError as err:
+            print("Can't read {0}: {1}".format(opt.queries, str(err)))
+            sys.exit(1)
+        
+        found = [by_word[f] for f in forms if f in by_word]
+        
         if not opt.quiet:
-            print('Performing LSI with {0} topics'.format(opt.topics))
+            print('{0} of {1} query words have definitions'.format(len(found), len(forms)))
+        
+        subset = np.zeros(len(by_id), dtype=bool)
+        subset[found] = True
+        queries = queries & subset
     
-        lsi = models.LsiModel(corpus_tfidf, id2word=dictionary, num_topics=opt.topics)
+    # with a threshold, drop queries and candidates that can't reach it
+    
+    if opt.min_score is not None:
+        before = (queries.sum(), len(cand_ids))
         
-        corpus_final = lsi[corpus_tfidf]
+        q_ids, cand_ids = prune_by_bounds(vectors, inverse,
+            np.flatnonzero(queries), cand_ids, opt)
+        
+        queries = np.zeros(len(by_id), dtype=bool)
+        queries[q_ids] = True
+        
+        if not opt.quiet:
+            print('Scoring {0} of {1} queries against {2} of {3} candidates'.format(
+                len(q_ids), before[0], len(cand_ids), before[1]))
     
-    # calculate similarities
+    # index candidates by spelling to look for transliterations
     
-    if not opt.quiet:
-        print('Calculating similarities (please be patient)')
+    translit = None
+    
+    if opt.translit > 0:
+        if not opt.quiet:
+            print('Indexing candidates for transliteration matching')
         
-    dir_calc = os.path.join(tempdir, 'sims')
+        translit = StemIndex(by_id[cand_ids])
     
-    index = similarities.Similarity(dir_calc, corpus_final, len(corpus_final))
+    # take the headwords as queries, a block at a time
+    q_ids = np.flatnonzero(queries)
+    q_blocks = [q_ids[i:i + opt.block] for i in range(0, len(q_ids), opt.block)]
     
-    # consider frequency distribution
+    names = by_id.tolist()
     
-    rank = load_ranks(by_id, opt.quiet)
+    # the index works on distinct vectors, if they've been merged
     
-    # determine translation candidates, write output
-    file_out = open(opt.output, "w", encoding="utf_8")
+    c_ids = cand_ids
     
-    if not opt.quiet:
-        print('Writing translation candidates to {}'.format(opt.output))
+    if inverse is not None:
+        c_ids = np.unique(inverse[cand_ids])
+        
+        if not opt.quiet:
+            print('{0} distinct queries, {1} distinct candidates'.format(
+                len(np.unique(inverse[q_ids])), len(c_ids)))
     
-    # optional filter by language
-    filter = np.array([r is not None for r in rank])
-    if (opt.corpus == "latin"):
-        filter = filter & np.invert(np.array([is_greek(lem) for lem in by_id]))
-    elif (opt.corpus == "greek"):
-        filter = filter & np.array([is_greek(lem) for lem in by_id])
+    if use_terms:
+        if not opt.quiet:
+            print('Indexing candidates by term')
+        
+        similarity = termindex.TermIndex(vectors, c_ids)
+    elif opt.quantize > 0:
+        from TessPy import quantized
+        
+        if not opt.quiet:
+            print('Quantizing candidate vectors')
+        
+        similarity = quantized.QuantizedIndex(vectors, opt.topics,
+            c_ids, dir_calc + '.f32.npy')
+        
+        if not opt.quiet:
+            small, full = similarity.nbytes()
+            print('Candidate vectors take {0:.1f} MB as int8, {1:.0%} of {2:.1f} MB as float32'.format(
+                small / 2**20, small / full, full / 2**20))
+    else:
+        def similarity(q_ids):
+            return np.atleast_2d(index[[vectors[q] for q in q_ids]])[:, c_ids]
     
-    # take each headword in turn as a query    
-    pr = ProgressBar(maxval = len(by_word))
+    if inverse is not None:
+        similarity = dedup.Deduplicated(similarity, inverse, cand_ids)
     
-    results = []
-      
-    for q_id, sims in enumerate(index):
-        pr.update(pr.currval + 1)
-        q = by_id[q_id]
+    # scoring, formatting and writing each run in their own thread
+    
+    started = time.time()
+    
+    if opt.reverse is not None or opt.mnn:
+        # both directions come out of the same blocks: the best
+        # candidates for each query row-wise, and the best queries
+        # for each candidate column-wise
         
-        if opt.query == "greek" and not is_greek(q):
-            continue
-        if opt.query == "latin" and is_greek(q):
-            continue
-        if rank[q_id] is None:
-            continue
+        pr = ProgressBar(maxval = len(q_ids))
+        
+        columns = export.ColumnTop(len(cand_ids), opt.results)
         
-        # if child, only do every ith query
-        if opt.child is not None:
-            child_id, nchildren = opt.child
+        fwd = list(score_blocks(similarity, by_id, enumerate(q_blocks),
+            cand_ids, rank, translit, columns, opt, pr))
+        
+        pr.finish()
+        
+        fwd_ids = np.concatenate([b[2] for b in fwd])
+        fwd_scores = np.concatenate([b[3] for b in fwd])
+        rev_ids, rev_scores = columns.ids, columns.scores
+        
+        # optionally keep only pairs that are each other's best matches
+        if opt.mnn:
+            fwd_ok, rev_ok = export.mutual(q_ids, fwd_ids, cand_ids, rev_ids)
+            fwd_scores[~fwd_ok] = -np.inf
+            rev_scores[~rev_ok] = -np.inf
             
-            if q_id % nchildren != child_id % nchildren:
-                continue
+            if not opt.quiet:
+                print('{0} mutual nearest neighbour pairs'.format(int(fwd_ok.sum())))
+        
+        outputs = [(opt.output, q_ids, fwd_ids, fwd_scores)]
+        
+        if opt.reverse is not None:
+            outputs.append((opt.reverse, cand_ids, rev_ids, rev_scores))
         
-        # add query word to filter
-        filter[q_id] = False
-      
-        # apply filter
-        sims = sims[filter]
+        for filename, rows, hits, scores in outputs:
+            if not opt.quiet:
+                print('Writing translation candidates to {}'.format(filename))
+            
+            with open(filename, 'wb') as f:
+                for i in range(0, len(rows), opt.block):
+                    j = slice(i, i + opt.block)
+                    f.write(format_block((i, rows[j], hits[j], scores[j]), names)[1])
+    
+    elif opt.shared is None:
+        # output goes to a partial file, with a checkpoint recording how
+        # much of it is complete; --resume picks up from there
+        
+        checkpoint = export.Checkpoint(opt.output, job_key(names, q_ids, cand_ids, opt),
+            resume=opt.resume, interval=opt.checkpoint)
+        
+        if not opt.quiet:
+            if checkpoint.done > 0:
+                print('Resuming after {0} of {1} blocks'.format(checkpoint.done,
+                    len(q_blocks)))
+            print('Writing translation candidates to {}'.format(opt.output))
+        
+        pr = ProgressBar(maxval = len(q_ids))
+        pr.update(sum(len(b) for b in q_blocks[:checkpoint.done]))
+        
+        blocks = score_blocks(similarity, by_id,
+            list(enumerate(q_blocks))[checkpoint.done:],
+            cand_ids, rank, translit, None, opt, pr)
+        
+        export.run_stages(blocks,
+            lambda block: format_block(block, names, opt.min_score is not None),
+            checkpoint)
+        
+        checkpoint.finish()
+        pr.finish()
     
-        # apply distribution difference metric
-        sims -= np.absolute((rank[q_id] - rank[filter]) * opt.weight)
+    else:
+        # every node must be doing exactly the same job
+        
+        try:
+            shared = lease.SharedRun(opt.shared, len(q_blocks),
+                job_key(names, q_ids, cand_ids, opt), opt.lease)
+        except (IOError, ValueError) as err:
+            print("Can't use {0}: {1}".format(opt.shared, str(err)))
+            sys.exit(1)
+        
+        if not opt.quiet:
+            print('Sharing work through {0} as {1}'.format(opt.shared, shared.worker))
+        
+        pr = ProgressBar(maxval = len(q_ids))
+        
+        blocks = score_blocks(similarity, by_id,
+            ((k, q_blocks[k]) for k in shared.claim()),
+            cand_ids, rank, translit, None, opt, pr)
+        
+        export.run_stages(blocks,
+            lambda block: format_block(block, names, opt.min_score is not None),
+            shared.commit)
+        
+        pr.finish()
+        
+        # claim() only finishes once every block is done, so this
+        # node may as well put them together
+        
+        if not opt.quiet:
+            print('Writing translation candidates to {}'.format(opt.output))
+        
+        shared.merge(opt.output)
     
-        # add result words and sort by score
-        sims = zip(by_id[np.arange(len(by_id))][filter], sims)
-        sims = sorted(sims, key=lambda res: res[1], reverse=True)
+    if not opt.quiet:
+        print('Scored {0} queries against {1} candidates in {2:.1f} seconds'.format(
+            len(q_ids), len(cand_ids), time.time() - started))
     
-        results = ["{0}:{1}".format(res, sim) for res, sim in sims[:opt.results]]
-        file_out.write("{0},".format(q))
-        file_out.write(",".join(results))
-        file_out.write("\n")
+    # how did it do?
     
-    pr.finish()
-
-    file_out.close()
+    if opt.benchmark is not None:
+        from TessPy import benchmark
+        
+        try:
+            bench = benchmark.read_benchmark(opt.benchmark)
+        except (IOError, KeyError, ValueError) as err:
+            print("Can't read benchmark: {0}".format(str(err)))
+            sys.exit(1)
+        
+        right, wrong, missing = benchmark.precision(opt.output, bench,
+            swap = opt.query == "latin")
+        
+        print('Benchmark: {0} right, {1} wrong, {2} not judged; precision {3:.3f}'.format(
+            right, wrong, missing, right / max(right + wrong, 1)))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,125 @@
+'''shared fixtures: a small synthetic corpus, and a way to run the scripts
+against it
+
+The scripts keep their data under the hard-coded `basedir` and `tempdir`,
+so they're run in a child process that loads them as modules, points
+those two at a temporary directory, and calls main().
+'''
+
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'scripts')
+
+# so tests can use TessPy directly
+sys.path.insert(0, SCRIPTS)
+
+BOOT = '''
+import importlib.util, os, sys
+path, basedir, tempdir, fail_after = sys.argv[1:5]
+sys.path.insert(0, os.path.dirname(path))
+spec = importlib.util.spec_from_file_location('script', path)
+mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mod)
+mod.basedir, mod.tempdir = basedir, tempdir
+if int(fail_after) > 0:
+    # simulate an interruption after that many blocks have been formatted
+    format_block = mod.format_block
+    count = [0]
+    def failing(*args, **kwargs):
+        count[0] += 1
+        if count[0] > int(fail_after):
+            raise KeyboardInterrupt
+        return format_block(*args, **kwargs)
+    mod.format_block = failing
+sys.argv = [path] + sys.argv[5:]
+mod.main()
+'''
+
+# headwords spelled alike in both languages, for --translit to find
+
+COGNATES = [('a)/ggelos', 'angelus'), ('lo/gos', 'logos'), ('qe/atron', 'theatrum'),
+    ('filosofi/a', 'philosophia'), ('ko/smos', 'cosmus')]
+
+WORDS = ('be bull goat fish live lion fight mountain bird sea god run earth '
+    + 'wine dog tree child ship hear war man die silver make bread woman '
+    + 'moon king sun sky river fire stone love wood horse wolf song law').split()
+
+
+def lexicon(lang, heads, rng):
+    '''the XML of a lexicon with a few random definitions for each headword'''
+
+    tag = {'la': ('<hi rend="ital">', '</hi>'), 'grc': ('<tr>', '</tr>')}[lang]
+    lines = ['<?xml version="1.0"?>', '<TEI>']
+
+    for i, head in enumerate(heads):
+        senses = ''.join('<sense>{0}{1}{2}</sense>'.format(tag[0],
+            ' '.join(rng.sample(WORDS, rng.randint(1, 3))), tag[1])
+            for _ in range(rng.randint(1, 2)))
+
+        lines.append('<entryFree id="n{0}" key="{1}" type="main">{2}</entryFree>'.format(
+            i, head, senses))
+
+    lines.append('</TEI>')
+
+    return '\n'.join(lines) + '\n'
+
+
+def headwords(n, rng):
+    letters = 'abcdefghiklmnoprstu'
+    heads = set()
+
+    while len(heads) < n:
+        heads.add(''.join(rng.choice(letters) for _ in range(rng.randint(3, 7))))
+
+    return sorted(heads)
+
+
+def run_script(name, args, corpus, fail_after=0, timeout=120):
+    '''run scripts/name against the corpus; returns the finished process'''
+
+    basedir, tempdir = corpus
+
+    return subprocess.run([sys.executable, '-c', BOOT,
+        os.path.join(SCRIPTS, name), basedir, tempdir, str(fail_after)]
+        + [str(a) for a in args],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, timeout=timeout)
+
+
+@pytest.fixture(scope='session')
+def corpus(tmp_path_factory):
+    '''(basedir, tempdir) holding lexica, stoplists and the corpus that
+    read-lexicon.py builds from them'''
+
+    pytest.importorskip('numpy')
+    pytest.importorskip('gensim')
+    pytest.importorskip('progressbar')
+
+    root = tmp_path_factory.mktemp('corpus')
+    basedir, tempdir = str(root / 'base'), str(root / 'data')
+    os.makedirs(os.path.join(basedir, 'data'))
+
+    rng = random.Random(1)
+
+    for lang, n in [('la', 400), ('grc', 300)]:
+        cognates = [c[lang == 'la'] for c in COGNATES]
+        heads = sorted(set(headwords(n, rng)) | set(cognates))
+
+        with open(os.path.join(basedir, 'data', lang + '.lexicon.xml'), 'w') as f:
+            f.write(lexicon(lang, heads, rng))
+
+        with open(os.path.join(basedir, 'data', lang + '.stem.freq'), 'w') as f:
+            f.write('# count: 1000000\n')
+            for head in heads:
+                f.write('{0}\t{1}\n'.format(head, rng.randint(1, 5000)))
+
+    done = run_script('read-lexicon.py', ['--quiet'], (basedir, tempdir))
+    assert done.returncode == 0, done.stderr
+
+    return basedir, tempdir
@@ -0,0 +1,43 @@
+'''choosing the top hits from blocks of scores'''
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from TessPy import export
+
+
+def stable_top(block, k):
+    top = np.argsort(-block, axis=1, kind='stable')[:, :k]
+
+    return top, np.take_along_axis(block, top, axis=1)
+
+
+def test_top_hits_ties():
+    # few distinct values, so most rows tie at the cut-off
+    rng = np.random.RandomState(0)
+    block = rng.randint(0, 4, size=(2000, 25)).astype(np.float32)
+    block[rng.rand(*block.shape) < 0.1] = -np.inf
+
+    for k in 1, 3, 10, 25, 40:
+        top, scores = export.top_hits(block, k)
+        want_top, want_scores = stable_top(block, k)
+
+        assert np.array_equal(top, want_top)
+        assert np.array_equal(scores, want_scores)
+
+
+def test_column_top_ties():
+    rng = np.random.RandomState(1)
+    block = rng.randint(0, 3, size=(600, 7)).astype(np.float32)
+    row_ids = np.arange(100, 700)
+
+    columns = export.ColumnTop(block.shape[1], 4)
+
+    for i in range(0, len(block), 64):
+        columns.update(block[i:i + 64], row_ids[i:i + 64])
+
+    want_top, want_scores = stable_top(block.T, 4)
+
+    assert np.array_equal(columns.ids, row_ids[want_top])
+    assert np.array_equal(columns.scores, want_scores)
@@ -0,0 +1,64 @@
+'''the headword index over the lexica, through read-lexicon.py --lookup'''
+
+import os
+import shutil
+
+import pytest
+
+from conftest import run_script
+
+
+@pytest.fixture
+def copy(corpus, tmp_path):
+    '''a copy of the corpus that the test may change'''
+
+    basedir, tempdir = str(tmp_path / 'base'), str(tmp_path / 'data')
+    shutil.copytree(corpus[0], basedir)
+    os.makedirs(tempdir)
+
+    return basedir, tempdir
+
+
+def lookup(copy, *words):
+    args = []
+
+    for word in words:
+        args += ['--lookup', word]
+
+    return run_script('read-lexicon.py', args + ['--lang', 'la'], copy)
+
+
+def test_lookup(copy):
+    done = run_script('read-lexicon.py', ['--stage', 'index', '--quiet'], copy)
+    assert done.returncode == 0, done.stderr
+
+    # keys in the lexicon often carry a number, e.g. "amo1"
+    done = lookup(copy, 'logos', 'logos1', 'nosuchword')
+    assert done.returncode == 0, done.stderr
+
+    lines = done.stdout.splitlines()
+    assert lines[0].startswith('logos [la]: ')
+    assert lines[1] == lines[0].replace('logos', 'logos1', 1)
+    assert lines[2] == 'nosuchword: not found'
+
+
+def test_lookup_without_index(copy):
+    done = lookup(copy, 'logos')
+
+    assert done.returncode == 1
+    assert done.stdout.startswith("Can't read index: ")
+
+
+def test_lookup_changed_lexicon(copy):
+    done = run_script('read-lexicon.py', ['--stage', 'index', '--quiet'], copy)
+    assert done.returncode == 0, done.stderr
+
+    filename = os.path.join(copy[0], 'data', 'la.lexicon.xml')
+    info = os.stat(filename)
+    os.utime(filename, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+
+    done = lookup(copy, 'logos')
+
+    assert done.returncode == 1
+    assert done.stdout.startswith("Can't read index: ")
+    assert 'has changed' in done.stdout
@@ -0,0 +1,37 @@
+'''read-lexicon.py's output, whole and in stages'''
+
+import os
+
+from conftest import run_script
+
+OUTPUTS = ['defs_bow.json', 'defs_full.ndjson', 'lookup_id.json', 'lookup_word.json']
+
+
+def spills(tempdir):
+    '''ndjson files other than the saved definitions'''
+
+    return [name for name in os.listdir(tempdir) if name.endswith('.ndjson')
+        and not name.startswith('defs_full')]
+
+
+def test_no_spill_files_left(corpus):
+    assert spills(corpus[1]) == []
+
+
+def test_stages(corpus, tmp_path):
+    staged = (corpus[0], str(tmp_path / 'data'))
+
+    for args in [['--stage', 'parse', '--lang', 'la'],
+            ['--stage', 'parse', '--lang', 'grc'],
+            ['--stage', 'stoplist'], ['--stage', 'build']]:
+        done = run_script('read-lexicon.py', args + ['--quiet'], staged)
+        assert done.returncode == 0, done.stderr
+
+    assert spills(staged[1]) == []
+
+    for name in OUTPUTS:
+        with open(os.path.join(corpus[1], name), 'rb') as f:
+            whole = f.read()
+
+        with open(os.path.join(staged[1], name), 'rb') as f:
+            assert f.read() == whole, name
@@ -0,0 +1,143 @@
+'''end-to-end runs of sims-export.py on the synthetic corpus'''
+
+import json
+import os
+
+import pytest
+
+from conftest import run_script
+
+THRESHOLD = ['--min-score', 0.2, '--results', 0, '--weight', 0, '--block', 4,
+    '--quiet']
+
+
+def read_rows(filename):
+    '''the hits in an output file, as (name, score) pairs by query'''
+
+    rows = dict()
+
+    with open(filename, encoding='utf_8') as f:
+        for line in f:
+            query, hits = line.rstrip('\n').split(',', 1)
+            rows[query] = [(h.rsplit(':', 1)[0], float(h.rsplit(':', 1)[1]))
+                for h in hits.split(',')]
+
+    return rows
+
+
+def assert_same_rows(got, want):
+    '''each row of got has the hits the same row of want does, with
+    scores that may differ by rounding'''
+
+    for query, hits in got.items():
+        assert [h[0] for h in hits] == [h[0] for h in want[query]], query
+        assert [h[1] for h in hits] == pytest.approx(
+            [h[1] for h in want[query]], abs=1e-5), query
+
+
+def export(corpus, output, *args, **kwargs):
+    done = run_script('sims-export.py', ['--output', output] + THRESHOLD
+        + list(args), corpus, **kwargs)
+    assert done.returncode == 0, done.stderr
+
+    with open(output, 'rb') as f:
+        return f.read()
+
+
+def test_min_score_shared(corpus, tmp_path):
+    expected = export(corpus, str(tmp_path / 'all.csv'))
+    assert expected
+
+    shared = tmp_path / 'shared'
+    got = export(corpus, str(tmp_path / 'shared.csv'), '--shared', str(shared),
+        timeout=60)
+
+    assert got == expected
+
+    # one block file for each block number, and no others
+    blocks = sorted(int(name.split('.')[0]) for name in os.listdir(str(shared / 'blocks'))
+        if name.endswith('.csv'))
+    assert blocks == list(range(len(blocks)))
+
+
+def test_min_score_resume(corpus, tmp_path):
+    expected = export(corpus, str(tmp_path / 'all.csv'))
+
+    output = str(tmp_path / 'resumed.csv')
+
+    # interrupted partway, with a checkpoint after every block
+    done = run_script('sims-export.py', ['--output', output, '--checkpoint', 0]
+        + THRESHOLD, corpus, fail_after=5)
+    assert done.returncode != 0
+
+    with open(output + '.ckpt') as f:
+        assert json.load(f)['blocks'] <= 5
+
+    assert export(corpus, output, '--resume') == expected
+
+
+def test_min_score_negative_weight(corpus, tmp_path):
+    # the penalty doesn't depend on the sign of --weight, so pruning by
+    # bounds is safe either way
+    expected = export(corpus, str(tmp_path / 'plus.csv'), '--weight', 0.1)
+    assert expected
+
+    assert export(corpus, str(tmp_path / 'minus.csv'), '--weight', -0.1) == expected
+
+
+def test_queries_match_full_export(corpus, tmp_path):
+    from conftest import COGNATES
+
+    queries = tmp_path / 'queries.txt'
+    queries.write_text('\n'.join(grc for grc, la in COGNATES) + '\n', encoding='utf_8')
+
+    # a penalty can leave candidates that share no terms among the best
+    for args in [['--translit', 2], ['--weight', 0.1]]:
+        args = ['--results', 3, '--quiet'] + args
+
+        full = run_script('sims-export.py', ['--output', str(tmp_path / 'full.csv')]
+            + args, corpus)
+        assert full.returncode == 0, full.stderr
+
+        some = run_script('sims-export.py', ['--output', str(tmp_path / 'some.csv'),
+            '--queries', str(queries)] + args, corpus)
+        assert some.returncode == 0, some.stderr
+
+        some = read_rows(str(tmp_path / 'some.csv'))
+        assert len(some) == len(COGNATES)
+
+        # the same candidates; the scores can differ in the last bit, since
+        # the full path sums the products in a different order
+        assert_same_rows(some, read_rows(str(tmp_path / 'full.csv')))
+
+
+def test_quantize_matches_float(corpus, tmp_path):
+    # at --weight 0 the shortlist often ends among tied candidates
+    args = ['--results', 3, '--weight', 0, '--topics', 20, '--quiet']
+
+    for name, more in [('float.csv', []), ('int8.csv', ['--quantize', 10])]:
+        done = run_script('sims-export.py', ['--output', str(tmp_path / name)]
+            + args + more, corpus)
+        assert done.returncode == 0, done.stderr
+
+    assert_same_rows(read_rows(str(tmp_path / 'int8.csv')),
+        read_rows(str(tmp_path / 'float.csv')))
+
+
+def test_reverse_matches_reverse_export(corpus, tmp_path):
+    # ties are common at --weight 0: identical bags give identical cosines
+    args = ['--results', 3, '--weight', 0, '--quiet']
+
+    done = run_script('sims-export.py', ['--output', str(tmp_path / 'fwd.csv'),
+        '--reverse', str(tmp_path / 'rev.csv')] + args, corpus)
+    assert done.returncode == 0, done.stderr
+
+    done = run_script('sims-export.py', ['--output', str(tmp_path / 'latin.csv'),
+        '--query', 'latin', '--corpus', 'greek'] + args, corpus)
+    assert done.returncode == 0, done.stderr
+
+    with open(str(tmp_path / 'rev.csv'), 'rb') as f:
+        reverse = f.read()
+
+    with open(str(tmp_path / 'latin.csv'), 'rb') as f:
+        assert reverse == f.read()
@@ -0,0 +1,65 @@
+'''--help has to come back quickly, without loading the heavy modules'''
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import SCRIPTS
+
+HEAVY = ['numpy', 'gensim', 'progressbar', 'stemming']
+
+# seconds all the imports may take between them; importing numpy and
+# gensim alone takes several times this
+BUDGET = 0.3
+
+BOOT = '''
+import json, runpy, sys
+try:
+    runpy.run_path(sys.argv[1], run_name='__main__')
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)))
+'''
+
+
+def import_times(stderr):
+    '''seconds taken by each top-level import, from -X importtime output'''
+
+    times = dict()
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line.split('|')
+
+        # nested imports are indented, and already counted by their parent
+        if not name[1:].startswith(' '):
+            times[name.strip()] = int(cumulative) / 1e6
+
+    return times
+
+
+@pytest.mark.parametrize('script', ['sims-export.py', 'read-lexicon.py'])
+def test_help_is_light(script):
+    done = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT,
+        os.path.join(SCRIPTS, script), '--help'], cwd=SCRIPTS,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, timeout=60)
+
+    assert done.returncode == 0, done.stderr
+    assert 'usage:' in done.stdout
+
+    modules = json.loads(done.stdout.splitlines()[-1])
+    loaded = [m for m in modules if m.split('.')[0] in HEAVY]
+
+    assert loaded == []
+
+    times = import_times(done.stderr)
+    slowest = sorted(times, key=times.get, reverse=True)[:5]
+
+    assert sum(times.values()) < BUDGET, ', '.join(
+        '{0} {1:.3f}s'.format(m, times[m]) for m in slowest)